@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import tempfile
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -80,6 +81,25 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # Take the write lock when a transaction starts and wait for it,
+            # instead of failing with "database is locked" under concurrent submits.
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
+    }
+}
+
+
+# Cache
+# Shared by all worker processes on the host: the Grant and restriction
+# ruleset caches in leave.models keep the version tokens that tell every
+# process to reload here. Use Memcached or Redis when running on several hosts.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': Path(tempfile.gettempdir()) / 'vts-cache',
     }
 }
 
@@ -135,4 +155,16 @@ EMAIL_HOST_USER = 'shalem.raju@tvsmotor.com'  # Your email address
 EMAIL_HOST_PASSWORD = 'your_email_password' # Your email password or app-specific password
 DEFAULT_FROM_EMAIL = 'no-reply@example.com' # Default "from" email address for outgoing emails
 
-LOGIN_REDIRECT_URL = '/leave/'
\ No newline at end of file
+LOGIN_REDIRECT_URL = '/leave/'
+
+# Restriction validation metrics (see leave/metrics.py). Validations slower
+# than this many seconds are logged to 'leave.metrics', sampled at this rate.
+LEAVE_SLOW_VALIDATION_SECONDS = 0.05
+LEAVE_SLOW_VALIDATION_SAMPLE_RATE = 0.1
+# Who may read /leave/metrics/: staff users and scrapers sending
+# "Authorization: Bearer <LEAVE_METRICS_TOKEN>" when a token is set.
+# Everyone else gets a 403. LEAVE_METRICS_ALLOWED_IPS can admit fixed
+# addresses as well; leave it empty behind a reverse proxy, where every
+# client shares the proxy's REMOTE_ADDR.
+LEAVE_METRICS_TOKEN = None
+LEAVE_METRICS_ALLOWED_IPS = []
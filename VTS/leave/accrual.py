@@ -0,0 +1,106 @@
+"""
+Yearly rollover of leave balances and enforcement of Grant.expiration_date.
+
+run_rollover() walks UserLeaveBalance in keyset chunks of primary keys.
+For each chunk it:
+
+- reads the rows (locked on databases that support it),
+- works out the new figures in memory against the cached grants,
+- writes them back with one UPDATE per distinct result plus one
+  bulk_create of ledger entries,
+- records the last id in a JobCheckpoint.
+
+Each chunk commits on its own, so memory stays bounded and a crashed run
+resumes after the last committed chunk. Rows are only rolled over when
+their period_year is behind, so reprocessing a chunk is harmless.
+"""
+from django.db import transaction
+
+from .models import JobCheckpoint, LeaveLedgerEntry, UserLeaveBalance, get_grant
+
+
+def roll_balance(remaining, grant, year, period_year, as_of):
+    """
+    Return (allocated, remaining, expired_hours, granted_hours) for one
+    balance, or None if it needs no change.
+
+    An expired grant forfeits everything left on it and grants nothing
+    new. Otherwise a balance from an earlier leave year keeps up to
+    max_carryover_hours of what is left and receives a fresh allocation.
+    """
+    remaining = remaining or 0
+    if grant is not None and grant.expiration_date is not None and grant.expiration_date <= as_of:
+        if remaining <= 0 and period_year >= year:
+            return None
+        allocated = 0 if period_year < year else None
+        return allocated, min(remaining, 0), max(remaining, 0), 0
+    if period_year >= year:
+        return None
+    if grant is None:
+        # No grant for this role any more: nothing new, nothing forfeited.
+        return 0, remaining, 0, 0
+    carried = remaining
+    if grant.max_carryover_hours is not None and remaining > grant.max_carryover_hours:
+        carried = grant.max_carryover_hours
+    return grant.allocated_hours, carried + grant.allocated_hours, remaining - carried, grant.allocated_hours
+
+
+def _roll_chunk(last_id, year, as_of, chunk_size):
+    """Roll over the next chunk after last_id. Returns (new last_id or None when done, balances changed)."""
+    with transaction.atomic():
+        rows = list(
+            UserLeaveBalance.objects.select_for_update().filter(id__gt=last_id).order_by('id').values_list(
+                'id', 'user_id', 'category_id', 'user__role', 'allocated_hours', 'remaining_hours', 'period_year'
+            )[:chunk_size]
+        )
+        if not rows:
+            return None, 0
+        updates = {}  # (allocated, remaining, period_year) -> balance ids
+        entries = []
+        for balance_id, user_id, category_id, role, allocated, remaining, period_year in rows:
+            rolled = roll_balance(remaining, get_grant(role, category_id), year, period_year, as_of)
+            if rolled is None:
+                continue
+            new_allocated, new_remaining, expired, granted = rolled
+            values = (allocated if new_allocated is None else new_allocated, new_remaining, max(year, period_year))
+            updates.setdefault(values, []).append(balance_id)
+            if expired:
+                entries.append(LeaveLedgerEntry(user_id=user_id, category_id=category_id, kind='expiry', hours=-expired))
+            if granted:
+                entries.append(LeaveLedgerEntry(user_id=user_id, category_id=category_id, kind='grant', hours=granted))
+        # Most balances in a chunk end up with the same figures, so one UPDATE
+        # per distinct result is far cheaper than bulk_update's per-row CASE.
+        for (new_allocated, new_remaining, new_year), balance_ids in updates.items():
+            UserLeaveBalance.objects.filter(id__in=balance_ids).update(
+                allocated_hours=new_allocated, remaining_hours=new_remaining, period_year=new_year,
+            )
+        LeaveLedgerEntry.objects.bulk_create(entries, batch_size=1000)
+        last_id = rows[-1][0]
+        JobCheckpoint.objects.filter(name=f'rollover:{year}').update(position=last_id)
+    return last_id, sum(len(balance_ids) for balance_ids in updates.values())
+
+
+def run_rollover(year, as_of, chunk_size=2000, restart=False, stdout=None):
+    """
+    Roll every balance over into the given leave year, expiring grants
+    that have expired by as_of. Resumes from the checkpoint of an earlier
+    unfinished run unless restart is set. Returns the number of balances
+    changed by this run.
+    """
+    checkpoint, _ = JobCheckpoint.objects.get_or_create(name=f'rollover:{year}')
+    if restart or checkpoint.finished:
+        # A finished run is simply repeated; rows already rolled are left alone.
+        checkpoint.position = 0
+        checkpoint.finished = False
+        checkpoint.save()
+    last_id = checkpoint.position
+    changed = 0
+    while True:
+        last_id, chunk_changed = _roll_chunk(last_id, year, as_of, chunk_size)
+        if last_id is None:
+            break
+        changed += chunk_changed
+        if stdout:
+            stdout.write(f"Processed balances up to id {last_id} ({changed} changed).")
+    JobCheckpoint.objects.filter(pk=checkpoint.pk).update(finished=True)
+    return changed
@@ -1,7 +1,7 @@
 from django.contrib import admin
 
 
-from .models import User, Location, Category, Grant, Request, DateExclusionRestriction, AdjacentDayRestriction, ConsecutiveDayRestriction, CoworkerRestriction, DayOfWeekRestriction, PeriodLimitRestriction, UserLeaveBalance
+from .models import User, Location, Category, Grant, Request, DateExclusionRestriction, AdjacentDayRestriction, ConsecutiveDayRestriction, CoworkerRestriction, DayOfWeekRestriction, PeriodLimitRestriction, UserLeaveBalance, OutboxEmail
 
 # Register your models here.
 admin.site.register(User)
@@ -16,4 +16,5 @@ admin.site.register(CoworkerRestriction)
 admin.site.register(DayOfWeekRestriction)
 admin.site.register(PeriodLimitRestriction)
 admin.site.register(UserLeaveBalance)
+admin.site.register(OutboxEmail)
 
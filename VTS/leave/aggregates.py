@@ -0,0 +1,390 @@
+"""
+Maintenance of derived tables that are kept in step with Request and User
+rows so that hot paths can read them instead of aggregating over Request.
+
+The incremental functions are called from leave.signals; the rebuild and
+check functions back the corresponding management commands.
+"""
+import datetime
+
+from django.db import connection, transaction
+from django.db.models import Count, ExpressionWrapper, F, FloatField, Func, IntegerField, Max, Min, Q, Sum, Value
+from django.db.models.functions import Greatest, Least
+
+from .models import (
+    EmployeePeriodHours,
+    Location,
+    LocationDayStaffing,
+    Request,
+    RequestState,
+    User,
+    UtilizationRollup,
+    count_on_leave_by_day,
+    next_period_start,
+    split_hours_by_period,
+)
+
+
+def _is_active(state):
+    return state is not None and state.status in Request.ACTIVE_STATUSES
+
+
+# ---------------------------
+# Location staffing
+# ---------------------------
+def adjust_location_days(location_id, start_date, end_date, delta):
+    """Add delta to the on-leave count of every day in [start_date, end_date]."""
+    if location_id is None or delta == 0:
+        return
+    num_days = (end_date - start_date).days + 1
+    # Make sure a row exists for every day, then shift all of them in one UPDATE.
+    LocationDayStaffing.objects.bulk_create(
+        [
+            LocationDayStaffing(location_id=location_id, date=start_date + datetime.timedelta(days=offset))
+            for offset in range(num_days)
+        ],
+        ignore_conflicts=True,
+    )
+    LocationDayStaffing.objects.filter(
+        location_id=location_id, date__gte=start_date, date__lte=end_date
+    ).update(on_leave_count=F('on_leave_count') + delta)
+
+
+def apply_request_change(old_state, new_state):
+    """
+    Update derived tables for a request moving from old_state to new_state
+    (RequestState or None for a created/deleted request).
+    """
+    apply_request_changes([(old_state, new_state)])
+
+
+def apply_request_changes(changes):
+    """
+    apply_request_change() for many (old_state, new_state) pairs at once,
+    e.g., after a bulk status UPDATE. Deltas are summed first, so the
+    number of writes depends on the distinct days and periods touched
+    rather than on the number of requests.
+    """
+    relevant = []
+    utilization = []
+    for old_state, new_state in changes:
+        if not _is_active(old_state) and not _is_active(new_state) or old_state == new_state:
+            continue
+        # An approval moves hours from pending to taken in the utilization
+        # rollup, but submitted and approved count the same everywhere else.
+        utilization.append((old_state, new_state))
+        if _is_active(old_state) and _is_active(new_state) and old_state._replace(status=new_state.status) == new_state:
+            continue
+        relevant.append((old_state, new_state))
+    if not utilization:
+        return
+    employee_ids = {state.employee_id for state, _ in _active_deltas(utilization)}
+    locations = dict(User.objects.filter(pk__in=employee_ids).values_list('id', 'location_id'))
+    with transaction.atomic():
+        _apply_staffing_changes(relevant, locations)
+        _apply_period_hours_changes(relevant)
+        _apply_utilization_deltas(_utilization_deltas(
+            (state, locations.get(state.employee_id), sign) for state, sign in _active_deltas(utilization)
+        ))
+
+
+def _active_deltas(changes):
+    """Yield (state, +1/-1) for every active state being removed or added."""
+    for old_state, new_state in changes:
+        if _is_active(old_state):
+            yield old_state, -1
+        if _is_active(new_state):
+            yield new_state, 1
+
+
+def _apply_staffing_changes(changes, locations):
+    """Shift LocationDayStaffing for the changes; locations maps employee id to location id."""
+    deltas = {}
+    for state, sign in _active_deltas(changes):
+        location_id = locations.get(state.employee_id)
+        if location_id is None:
+            continue
+        for offset in range((state.end_date - state.start_date).days + 1):
+            key = (location_id, state.start_date + datetime.timedelta(days=offset))
+            deltas[key] = deltas.get(key, 0) + sign
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    # Make sure a row exists for every day gaining leave, then shift the days
+    # that move by the same amount at a location together. Days losing leave
+    # already have a row, unless it went away in a cascading delete.
+    LocationDayStaffing.objects.bulk_create(
+        [LocationDayStaffing(location_id=location_id, date=date) for (location_id, date), delta in deltas.items() if delta > 0],
+        ignore_conflicts=True,
+    )
+    groups = {}
+    for (location_id, date), delta in deltas.items():
+        groups.setdefault((location_id, delta), []).append(date)
+    for (location_id, delta), dates in groups.items():
+        LocationDayStaffing.objects.filter(location_id=location_id, date__in=dates).update(
+            on_leave_count=F('on_leave_count') + delta
+        )
+
+
+def apply_location_change(user_id, old_location_id, new_location_id):
+    """Move a user's headcount and active leave from one location to another."""
+    if old_location_id == new_location_id:
+        return
+    with transaction.atomic():
+        if old_location_id is not None:
+            Location.objects.filter(pk=old_location_id).update(headcount=F('headcount') - 1)
+        if new_location_id is not None:
+            Location.objects.filter(pk=new_location_id).update(headcount=F('headcount') + 1)
+        active = [RequestState(*row) for row in Request.objects.filter(
+            employee_id=user_id, status__in=Request.ACTIVE_STATUSES
+        ).values_list(*RequestState._fields)]
+        for state in active:
+            adjust_location_days(old_location_id, state.start_date, state.end_date, -1)
+            adjust_location_days(new_location_id, state.start_date, state.end_date, 1)
+        _apply_utilization_deltas(_utilization_deltas(
+            [(state, old_location_id, -1) for state in active] + [(state, new_location_id, 1) for state in active]
+        ))
+
+
+def compute_location_staffing(location_id):
+    """Compute {date: on_leave_count} for a location from the live Request table."""
+    intervals = list(Request.objects.filter(
+        employee__location_id=location_id, status__in=Request.ACTIVE_STATUSES
+    ).values_list('employee_id', 'start_date', 'end_date'))
+    if not intervals:
+        return {}
+    window_start = min(start for _, start, _ in intervals)
+    window_end = max(end for _, _, end in intervals)
+    counts = count_on_leave_by_day(intervals, window_start, window_end)
+    return {
+        window_start + datetime.timedelta(days=offset): count
+        for offset, count in enumerate(counts)
+        if count
+    }
+
+
+def rebuild_staffing(stdout=None):
+    """Recompute headcounts and LocationDayStaffing from scratch, one location at a time."""
+    headcounts = Location.objects.annotate(employee_count=Count('employees')).values_list('id', 'employee_count')
+    for location_id, employee_count in headcounts:
+        with transaction.atomic():
+            Location.objects.filter(pk=location_id).update(headcount=employee_count)
+            LocationDayStaffing.objects.filter(location_id=location_id).delete()
+            LocationDayStaffing.objects.bulk_create(
+                [
+                    LocationDayStaffing(location_id=location_id, date=date, on_leave_count=count)
+                    for date, count in compute_location_staffing(location_id).items()
+                ],
+                batch_size=1000,
+            )
+        if stdout:
+            stdout.write(f"Rebuilt staffing for location {location_id}.")
+
+
+def check_staffing():
+    """
+    Compare headcounts and LocationDayStaffing against the live data.
+    Returns a list of human-readable mismatch descriptions.
+    """
+    mismatches = []
+    headcounts = Location.objects.annotate(employee_count=Count('employees')).values_list('id', 'headcount', 'employee_count')
+    for location_id, headcount, employee_count in headcounts:
+        if headcount != employee_count:
+            mismatches.append(f"Location {location_id}: headcount {headcount}, expected {employee_count}.")
+        stored = dict(LocationDayStaffing.objects.filter(
+            location_id=location_id
+        ).exclude(on_leave_count=0).values_list('date', 'on_leave_count'))
+        expected = compute_location_staffing(location_id)
+        for date in sorted(stored.keys() | expected.keys()):
+            if stored.get(date, 0) != expected.get(date, 0):
+                mismatches.append(
+                    f"Location {location_id} on {date}: {stored.get(date, 0)} on leave, expected {expected.get(date, 0)}."
+                )
+    return mismatches
+
+
+# ---------------------------
+# Employee period hours
+# ---------------------------
+def period_hours_of(state):
+    """Return {(employee_id, category_id, period, period_start): hours} for an active request state."""
+    hours = {}
+    for period in EmployeePeriodHours.PERIODS:
+        split = split_hours_by_period(state.start_date, state.end_date, state.hours_per_day, period)
+        for period_start, period_hours in split.items():
+            hours[(state.employee_id, state.category_id, period, period_start)] = period_hours
+    return hours
+
+
+def _apply_period_hours_changes(changes):
+    deltas = {}
+    for state, sign in _active_deltas(changes):
+        for key, hours in period_hours_of(state).items():
+            deltas[key] = deltas.get(key, 0) + sign * hours
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    # Only create rows for periods gaining hours: when an employee is deleted
+    # their rows may cascade away before their requests, and re-inserting
+    # them here would leave rows pointing at a deleted user.
+    if connection.features.supports_update_conflicts_with_target:
+        # Gains spread over many employees (e.g., an import) would need an
+        # UPDATE each; one upsert per batch adds them all.
+        _add_period_hours({key: delta for key, delta in deltas.items() if delta > 0})
+        deltas = {key: delta for key, delta in deltas.items() if delta < 0}
+    EmployeePeriodHours.objects.bulk_create(
+        [
+            EmployeePeriodHours(employee_id=employee_id, category_id=category_id, period=period, period_start=period_start)
+            for (employee_id, category_id, period, period_start), delta in deltas.items()
+            if delta > 0
+        ],
+        ignore_conflicts=True,
+    )
+    groups = {}
+    for (employee_id, category_id, period, period_start), delta in deltas.items():
+        groups.setdefault((employee_id, category_id, period, delta), []).append(period_start)
+    for (employee_id, category_id, period, delta), period_starts in groups.items():
+        EmployeePeriodHours.objects.filter(
+            employee_id=employee_id, category_id=category_id, period=period, period_start__in=period_starts
+        ).update(hours=F('hours') + delta)
+
+
+def _add_period_hours(deltas):
+    """Add {(employee_id, category_id, period, period_start): hours} with INSERT ... ON CONFLICT DO UPDATE."""
+    table = connection.ops.quote_name(EmployeePeriodHours._meta.db_table)
+    rows = list(deltas.items())
+    batch_size = min(500, (connection.features.max_query_params or 2500) // 5)
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            cursor.execute(
+                f"INSERT INTO {table} (employee_id, category_id, period, period_start, hours) VALUES "
+                + ", ".join(["(%s, %s, %s, %s, %s)"] * len(batch))
+                + f" ON CONFLICT (employee_id, category_id, period, period_start)"
+                f" DO UPDATE SET hours = {table}.hours + excluded.hours",
+                [
+                    value
+                    for (employee_id, category_id, period, period_start), hours in batch
+                    for value in (employee_id, category_id, period, connection.ops.adapt_datefield_value(period_start), hours)
+                ],
+            )
+
+
+def rebuild_period_hours(chunk_size=2000):
+    """Recompute the EmployeePeriodHours ledger from every active request."""
+    totals = {}
+    active = Request.objects.filter(status__in=Request.ACTIVE_STATUSES).values_list(*RequestState._fields)
+    for row in active.iterator(chunk_size=chunk_size):
+        for key, hours in period_hours_of(RequestState(*row)).items():
+            totals[key] = totals.get(key, 0) + hours
+    with transaction.atomic():
+        EmployeePeriodHours.objects.all().delete()
+        EmployeePeriodHours.objects.bulk_create(
+            [
+                EmployeePeriodHours(employee_id=employee_id, category_id=category_id, period=period, period_start=period_start, hours=hours)
+                for (employee_id, category_id, period, period_start), hours in totals.items()
+            ],
+            batch_size=1000,
+        )
+
+
+# ---------------------------
+# Utilization rollup
+# ---------------------------
+UTILIZATION_COLUMNS = {'approved': 'taken_hours', 'submitted': 'pending_hours'}
+
+
+def _utilization_deltas(signed_states):
+    """
+    Sum (state, location_id, +1/-1) triples into
+    {(category_id, location_id, month, column): hours}.
+    """
+    deltas = {}
+    for state, location_id, sign in signed_states:
+        if location_id is None:
+            continue
+        column = UTILIZATION_COLUMNS[state.status]
+        for month, hours in split_hours_by_period(state.start_date, state.end_date, state.hours_per_day, 'month').items():
+            key = (state.category_id, location_id, month, column)
+            deltas[key] = deltas.get(key, 0) + sign * hours
+    return {key: delta for key, delta in deltas.items() if delta}
+
+
+def _apply_utilization_deltas(deltas):
+    if not deltas:
+        return
+    # As for the other tables, only months gaining hours may need a new row.
+    UtilizationRollup.objects.bulk_create(
+        [
+            UtilizationRollup(category_id=category_id, location_id=location_id, month=month)
+            for (category_id, location_id, month, column), delta in deltas.items()
+            if delta > 0
+        ],
+        ignore_conflicts=True,
+    )
+    groups = {}
+    for (category_id, location_id, month, column), delta in deltas.items():
+        groups.setdefault((category_id, location_id, column, delta), []).append(month)
+    for (category_id, location_id, column, delta), months in groups.items():
+        UtilizationRollup.objects.filter(
+            category_id=category_id, location_id=location_id, month__in=months
+        ).update(**{column: F(column) + delta})
+
+
+class DaysBetween(Func):
+    """Whole days from the second date to the first (end - start)."""
+    arity = 2
+    arg_joiner = ' - '
+    template = '(%(expressions)s)'
+    output_field = IntegerField()
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self.as_sql(
+            compiler, connection,
+            template='CAST(JULIANDAY(%(expressions)s) AS INTEGER)', arg_joiner=') - JULIANDAY(',
+            **extra_context,
+        )
+
+    def as_mysql(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, function='DATEDIFF', template='%(function)s(%(expressions)s)', arg_joiner=', ', **extra_context)
+
+
+def compute_utilization(month):
+    """
+    Return {(category_id, location_id): (taken_hours, pending_hours)} for
+    the month starting on the given date, aggregated by the database.
+    """
+    month_end = next_period_start(month, 'month') - datetime.timedelta(days=1)
+    days = DaysBetween(
+        Least('end_date', Value(month_end)), Greatest('start_date', Value(month)),
+    ) + 1
+    hours = ExpressionWrapper(days * F('hours_per_day'), output_field=FloatField())
+    rows = Request.objects.filter(
+        status__in=Request.ACTIVE_STATUSES,
+        start_date__lte=month_end,
+        end_date__gte=month,
+        employee__location__isnull=False,
+    ).values('category_id', location_id=F('employee__location_id')).annotate(
+        taken=Sum(hours, filter=Q(status='approved'), default=0),
+        pending=Sum(hours, filter=Q(status='submitted'), default=0),
+    ).order_by()
+    return {(row['category_id'], row['location_id']): (row['taken'], row['pending']) for row in rows}
+
+
+def rebuild_utilization(stdout=None):
+    """Recompute the UtilizationRollup table from scratch, one aggregate query per month."""
+    span = Request.objects.filter(status__in=Request.ACTIVE_STATUSES).aggregate(first=Min('start_date'), last=Max('end_date'))
+    rollups = []
+    if span['first'] is not None:
+        month = span['first'].replace(day=1)
+        while month <= span['last']:
+            rollups += [
+                UtilizationRollup(category_id=category_id, location_id=location_id, month=month, taken_hours=taken, pending_hours=pending)
+                for (category_id, location_id), (taken, pending) in compute_utilization(month).items()
+            ]
+            if stdout:
+                stdout.write(f"Aggregated {month:%Y-%m}.")
+            month = next_period_start(month, 'month')
+    with transaction.atomic():
+        UtilizationRollup.objects.all().delete()
+        UtilizationRollup.objects.bulk_create(rollups, batch_size=1000)
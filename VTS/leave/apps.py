@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class LeaveConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'leave'
+
+    def ready(self):
+        # Connect signal handlers (restriction ruleset cache invalidation).
+        from . import signals  # noqa: F401
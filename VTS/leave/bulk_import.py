@@ -0,0 +1,180 @@
+"""
+Bulk import of historical or migrated leave requests from CSV or JSON
+Lines, backing the import_requests command.
+
+The file is read as a stream and handled in chunks. For each chunk:
+
+- employees (by username) and categories (by name) are resolved with one
+  query each;
+- rows are validated together with Request.validate_many(), optionally
+  without the restrictions;
+- valid rows are inserted with bulk_create in a transaction that also
+  advances a JobCheckpoint, so an interrupted import resumes after the
+  last committed chunk;
+- rejected rows go to an error report (CSV: line, errors, original row).
+
+bulk_create bypasses the Request signals and the balance ledger, so each
+chunk's transaction also applies its changes to the derived tables (see
+leave.aggregates). Later chunks are then checked against the earlier
+ones, memory stays bounded by the chunk size, and a crash never leaves
+imported rows without their derived data. Balances are not debited:
+imported requests are history.
+"""
+import csv
+import datetime
+import json
+import os
+
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import aggregates
+from .models import Category, JobCheckpoint, Request, RequestState, User
+
+FIELDS = ('employee', 'category', 'title', 'description', 'start_date', 'end_date', 'hours_per_day', 'status', 'submitted_at')
+STATUSES = {status for status, _ in Request.STATUS_CHOICES}
+DEFAULT_STATUS = 'approved'
+
+
+def read_rows(path, fmt):
+    """Yield (line number, row dict) from a CSV (with a header) or JSON Lines file."""
+    with open(path, newline='', encoding='utf-8') as handle:
+        if fmt == 'csv':
+            reader = csv.DictReader(handle)
+            for row in reader:
+                yield reader.line_num, row
+        else:
+            for line_number, line in enumerate(handle, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    row = None
+                yield line_number, row if isinstance(row, dict) else {'_raw': line.rstrip('\n')}
+
+
+def _build(row, user_ids, category_ids):
+    """Return (Request, []) for a well-formed row, or (None, [errors])."""
+    if '_raw' in row:
+        return None, ["Line is not a JSON object."]
+    errors = []
+    employee_id = user_ids.get(str(row.get('employee') or ''))
+    if employee_id is None:
+        errors.append(f"Unknown employee {row.get('employee')!r}.")
+    category_id = category_ids.get(str(row.get('category') or ''))
+    if category_id is None:
+        errors.append(f"Unknown category {row.get('category')!r}.")
+    dates = {}
+    for field in ('start_date', 'end_date'):
+        try:
+            dates[field] = datetime.date.fromisoformat(str(row.get(field) or ''))
+        except ValueError:
+            errors.append(f"{field} must be a date in YYYY-MM-DD format.")
+    try:
+        hours_per_day = float(row.get('hours_per_day') or 0)
+        if not 0 < hours_per_day <= 24:
+            raise ValueError
+    except (TypeError, ValueError):
+        errors.append("hours_per_day must be a number between 0 and 24.")
+    status = row.get('status') or DEFAULT_STATUS
+    if status not in STATUSES:
+        errors.append(f"Unknown status {status!r}.")
+    submitted_at = None
+    if row.get('submitted_at'):
+        submitted_at = parse_datetime(str(row['submitted_at']))
+        if submitted_at is None:
+            errors.append("submitted_at must be an ISO 8601 date and time.")
+        elif timezone.is_naive(submitted_at):
+            submitted_at = timezone.make_aware(submitted_at)
+    title = str(row.get('title') or '')[:255]
+    if not title:
+        errors.append("title is required.")
+    if errors:
+        return None, errors
+    return Request(
+        employee_id=employee_id, category_id=category_id, title=title,
+        description=str(row.get('description') or ''), start_date=dates['start_date'], end_date=dates['end_date'],
+        hours_per_day=hours_per_day, status=status, submitted_at=submitted_at,
+    ), []
+
+
+def _import_chunk(chunk, check_restrictions, checkpoint_name):
+    """Validate and insert one chunk. Returns (imported, [(line, row, errors)])."""
+    usernames = {str(row.get('employee')) for _, row in chunk if row.get('employee')}
+    category_names = {str(row.get('category')) for _, row in chunk if row.get('category')}
+    user_ids = dict(User.objects.filter(username__in=usernames).values_list('username', 'id'))
+    # Category names are not unique; the oldest category of a name wins.
+    category_ids = dict(Category.objects.filter(name__in=category_names).order_by('-id').values_list('name', 'id'))
+
+    rejected = []
+    built = []
+    for line_number, row in chunk:
+        request_obj, errors = _build(row, user_ids, category_ids)
+        if errors:
+            rejected.append((line_number, row, errors))
+        else:
+            built.append((line_number, row, request_obj))
+
+    with transaction.atomic():
+        results = Request.validate_many([request_obj for _, _, request_obj in built], restrictions=check_restrictions)
+        valid = []
+        for (line_number, row, request_obj), errors in zip(built, results):
+            if errors:
+                rejected.append((line_number, row, errors))
+            else:
+                valid.append(request_obj)
+        Request.objects.bulk_create(valid, batch_size=500)
+        aggregates.apply_request_changes([(None, RequestState(*(getattr(r, f) for f in RequestState._fields))) for r in valid])
+        JobCheckpoint.objects.filter(name=checkpoint_name).update(position=chunk[-1][0])
+    rejected.sort(key=lambda item: item[0])
+    return len(valid), rejected
+
+
+def import_requests(path, fmt=None, chunk_size=2000, check_restrictions=True, error_path=None, restart=False, stdout=None):
+    """
+    Import the file; returns (imported, rejected) counts for this run.
+    Rows up to the checkpoint of an earlier unfinished run are skipped
+    unless restart is set.
+    """
+    fmt = fmt or ('csv' if path.lower().endswith('.csv') else 'jsonl')
+    error_path = error_path or f"{path}.errors.csv"
+    checkpoint, _ = JobCheckpoint.objects.get_or_create(name=f'import_requests:{os.path.abspath(path)}')
+    if restart or checkpoint.finished:
+        checkpoint.position = 0
+        checkpoint.finished = False
+        checkpoint.save()
+    resume_after = checkpoint.position
+
+    imported = rejected = 0
+    # A resumed run appends to the report of the interrupted one.
+    with open(error_path, 'a' if resume_after else 'w', newline='', encoding='utf-8') as report:
+        writer = csv.writer(report)
+        if not resume_after:
+            writer.writerow(['line', 'errors', 'row'])
+        chunk = []
+
+        def flush():
+            nonlocal imported, rejected
+            count, errors = _import_chunk(chunk, check_restrictions, checkpoint.name)
+            for line_number, row, messages in errors:
+                writer.writerow([line_number, ' '.join(messages), json.dumps(row, default=str)])
+            report.flush()
+            imported += count
+            rejected += len(errors)
+            if stdout:
+                stdout.write(f"Imported up to line {chunk[-1][0]}: {imported} imported, {rejected} rejected.")
+            chunk.clear()
+
+        for line_number, row in read_rows(path, fmt):
+            if line_number <= resume_after:
+                continue
+            chunk.append((line_number, row))
+            if len(chunk) >= chunk_size:
+                flush()
+        if chunk:
+            flush()
+
+    JobCheckpoint.objects.filter(pk=checkpoint.pk).update(finished=True)
+    return imported, rejected
@@ -0,0 +1,115 @@
+"""
+iCalendar (RFC 5545) feeds of approved leave, for calendar clients that
+poll a URL: one feed per employee and one per manager's team.
+
+Clients cannot log in, so the feed URL carries a signed token naming the
+user, the feed kind and the user's feed_version; bumping the version
+(the "reset feed links" action) revokes every URL handed out before.
+Every poll costs one cheap aggregate query for the ETag; unchanged feeds
+get a 304 without any events being read. Otherwise the events are
+streamed from an iterator.
+"""
+import datetime
+import hashlib
+
+from django.core import signing
+from django.db.models import Count, Max
+from django.utils import timezone
+
+from .models import Request
+
+FEED_KINDS = ('mine', 'team')
+TOKEN_SALT = 'leave.ics-feed'
+# How far back the feeds go; clients keep older events they already have.
+HISTORY_DAYS = 365
+CHUNK_SIZE = 1000
+
+
+def feed_token(user, kind):
+    return signing.dumps([user.pk, kind, user.feed_version], salt=TOKEN_SALT)
+
+
+def read_feed_token(token):
+    """
+    Return (user_id, kind, feed_version); raises signing.BadSignature for
+    tampered, malformed or unknown tokens. The caller compares the version
+    with the user's current one.
+    """
+    try:
+        user_id, kind, version = signing.loads(token, salt=TOKEN_SALT)
+    except (TypeError, ValueError):
+        raise signing.BadSignature("Malformed feed token.")
+    if kind not in FEED_KINDS:
+        raise signing.BadSignature("Unknown feed kind.")
+    return user_id, kind, version
+
+
+def feed_requests(user, kind):
+    """Every request the feed covers, whatever its status (used for the validators)."""
+    if kind == 'team':
+        return Request.objects.filter(employee__in=user.subordinates.values('id'))
+    return Request.objects.filter(employee=user)
+
+
+def feed_etag(requests):
+    """
+    Strong ETag from one aggregate query. Any save bumps the latest
+    updated_at and any delete changes the count; today's date is included
+    because the feed's history window moves daily. There is no
+    Last-Modified: a delete can move the latest updated_at backwards, so
+    clients revalidating by date alone could miss it.
+    """
+    version = requests.aggregate(latest=Max('updated_at'), total=Count('id'))
+    today = timezone.now().date()
+    digest = hashlib.sha1(repr((version['latest'], version['total'], today)).encode()).hexdigest()
+    return f'"{digest}"'
+
+
+def _escape(text):
+    return text.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,').replace('\r\n', '\\n').replace('\n', '\\n')
+
+
+def _fold(line):
+    """Fold a content line at 75 octets, as the RFC requires."""
+    encoded = line.encode('utf-8')
+    if len(encoded) <= 75:
+        return line + '\r\n'
+    parts = []
+    while encoded:
+        limit = 75 if not parts else 74
+        cut = min(limit, len(encoded))
+        # Do not split a multi-byte character.
+        while cut < len(encoded) and (encoded[cut] & 0xC0) == 0x80:
+            cut -= 1
+        parts.append(encoded[:cut].decode('utf-8'))
+        encoded = encoded[cut:]
+    return '\r\n '.join(parts) + '\r\n'
+
+
+def stream_feed(requests, kind, name):
+    """Yield the feed document in chunks, one event at a time."""
+    yield (
+        'BEGIN:VCALENDAR\r\n'
+        'VERSION:2.0\r\n'
+        'PRODID:-//Vacation Tracking System//Leave Feed//EN\r\n'
+        'CALSCALE:GREGORIAN\r\n'
+        + _fold(f'X-WR-CALNAME:{_escape(name)}')
+    )
+    since = timezone.now().date() - datetime.timedelta(days=HISTORY_DAYS)
+    rows = requests.filter(status='approved', end_date__gte=since).order_by('start_date', 'id').values_list(
+        'id', 'employee__username', 'category__name', 'title', 'start_date', 'end_date', 'updated_at',
+    )
+    for request_id, username, category, title, start_date, end_date, updated_at in rows.iterator(chunk_size=CHUNK_SIZE):
+        summary = f"{username}: {category}" if kind == 'team' else f"{title} ({category})"
+        yield (
+            'BEGIN:VEVENT\r\n'
+            f'UID:leave-request-{request_id}@vts\r\n'
+            f'DTSTAMP:{updated_at.astimezone(datetime.timezone.utc):%Y%m%dT%H%M%SZ}\r\n'
+            f'DTSTART;VALUE=DATE:{start_date:%Y%m%d}\r\n'
+            # DTEND is exclusive for all-day events.
+            f'DTEND;VALUE=DATE:{end_date + datetime.timedelta(days=1):%Y%m%d}\r\n'
+            + _fold(f'SUMMARY:{_escape(summary)}')
+            + 'TRANSP:TRANSPARENT\r\n'
+            'END:VEVENT\r\n'
+        )
+    yield 'END:VCALENDAR\r\n'
@@ -0,0 +1,21 @@
+from contextlib import contextmanager
+
+from django.db import connection
+
+
+@contextmanager
+def throwaway_database(verbosity=0, test_name=None):
+    """
+    Run the enclosed block against a freshly migrated test database, the
+    same way the test runner does, so benchmarks never touch real data.
+    Pass test_name to use a file instead of SQLite's in-memory database,
+    e.g. when several threads need their own connections.
+    """
+    old_name = connection.settings_dict['NAME']
+    if test_name:
+        connection.settings_dict.setdefault('TEST', {})['NAME'] = test_name
+    connection.creation.create_test_db(verbosity=verbosity, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=verbosity)
@@ -0,0 +1,115 @@
+import datetime
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from leave.aggregates import rebuild_staffing
+from leave.management.benchmark import throwaway_database
+from leave.models import Category, CoworkerRestriction, Location, Request, User, ValidationResult
+
+
+def legacy_coworker_validate(restriction, request_obj):
+    """The original per-day CoworkerRestriction.validate(), kept for comparison."""
+    result = ValidationResult()
+    min_count = int(restriction.get_parameter("min_count"))
+
+    def get_scheduled_coworker_count(employee, date):
+        total_at_location = employee.location.employees.exclude(id=employee.id).count()
+        on_leave = Request.objects.filter(
+            employee__location=employee.location,
+            start_date__lte=date,
+            end_date__gte=date,
+            status__in=['submitted', 'approved']
+        ).values_list('employee', flat=True).distinct().count()
+        return total_at_location - on_leave
+
+    current_date = request_obj.start_date
+    while current_date <= request_obj.end_date:
+        scheduled_count = get_scheduled_coworker_count(request_obj.employee, current_date)
+        if scheduled_count < min_count:
+            result.add_error(
+                f"On {current_date}, only {scheduled_count} coworkers are scheduled, which is less than the required minimum of {min_count}."
+            )
+        current_date += datetime.timedelta(days=1)
+    return result
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare query counts and wall time of CoworkerRestriction.validate() "
+        "against the original per-day implementation. Runs against a "
+        "throwaway test database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--employees', type=int, default=2000, help="Employees at the seeded location.")
+        parser.add_argument('--requests', type=int, default=5000, help="Existing leave requests to seed.")
+        parser.add_argument('--days', type=int, default=30, help="Length of the validated request in days.")
+        parser.add_argument('--repeat', type=int, default=5, help="Timed runs per implementation.")
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        with throwaway_database():
+            self.run(options)
+
+    def run(self, options):
+        rng = random.Random(options['seed'])
+        start = datetime.date(2030, 1, 1)
+        location = Location.objects.create(name="benchmark location")
+        category = Category.objects.create(name="benchmark category")
+        User.objects.bulk_create(
+            User(username=f"bench-coworker-{i}", location=location) for i in range(options['employees'])
+        )
+        employees = list(User.objects.filter(location=location))
+        statuses = ['submitted', 'approved', 'rejected', 'withdrawn']
+        seeded = []
+        for i in range(options['requests']):
+            begin = start + datetime.timedelta(days=rng.randrange(-30, options['days'] + 30))
+            seeded.append(Request(
+                employee=rng.choice(employees),
+                category=category,
+                title=f"bench {i}",
+                start_date=begin,
+                end_date=begin + datetime.timedelta(days=rng.randrange(0, 14)),
+                hours_per_day=8,
+                status=rng.choice(statuses),
+            ))
+        Request.objects.bulk_create(seeded, batch_size=1000)
+        # bulk_create skips the signal handlers that maintain the staffing table.
+        rebuild_staffing()
+
+        restriction = CoworkerRestriction(name="benchmark", parameters={"min_count": options['employees'] - 50})
+        request_obj = Request(
+            employee=employees[0],
+            category=category,
+            title="benchmark request",
+            start_date=start,
+            end_date=start + datetime.timedelta(days=options['days'] - 1),
+            hours_per_day=8,
+        )
+
+        implementations = [
+            ("legacy per-day", lambda: legacy_coworker_validate(restriction, request_obj)),
+            ("staffing table", lambda: restriction.validate(request_obj)),
+        ]
+        outcomes = {}
+        for label, run in implementations:
+            with CaptureQueriesContext(connection) as queries:
+                outcome = run()
+            timings = []
+            for _ in range(options['repeat']):
+                began = time.perf_counter()
+                run()
+                timings.append(time.perf_counter() - began)
+            outcomes[label] = outcome.get_errors()
+            self.stdout.write(
+                f"{label:>15}: {len(queries):5d} queries, best {min(timings) * 1000:8.2f} ms, "
+                f"{len(outcome.get_errors())} errors"
+            )
+
+        if outcomes["legacy per-day"] != outcomes["staffing table"]:
+            raise CommandError("Staffing table result differs from the legacy implementation.")
+        self.stdout.write(self.style.SUCCESS("Results are identical."))
@@ -0,0 +1,138 @@
+import datetime
+import random
+import time
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from leave.aggregates import rebuild_period_hours, rebuild_staffing
+from leave.management.benchmark import throwaway_database
+from leave.models import (
+    AdjacentDayRestriction,
+    Category,
+    ConsecutiveDayRestriction,
+    CoworkerRestriction,
+    DateExclusionRestriction,
+    DayOfWeekRestriction,
+    Location,
+    PeriodLimitRestriction,
+    Request,
+    User,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare Request.validate_many() against calling full_clean() on each "
+        "request, for batches of the given sizes. Runs against a throwaway "
+        "test database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000], help="Batch sizes to validate.")
+        parser.add_argument('--baseline-limit', type=int, default=1000,
+                            help="Only run the full_clean() baseline for batches up to this size.")
+        parser.add_argument('--employees', type=int, default=2000)
+        parser.add_argument('--locations', type=int, default=10)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        with throwaway_database():
+            self.run(options)
+
+    def run(self, options):
+        rng = random.Random(options['seed'])
+        horizon = datetime.date(2030, 1, 1)
+        locations = Location.objects.bulk_create(
+            Location(name=f"plant {i}") for i in range(options['locations'])
+        )
+        category = Category.objects.create(name="shift leave")
+        User.objects.bulk_create(
+            User(username=f"bench-batch-{i}", location=rng.choice(locations)) for i in range(options['employees'])
+        )
+        employees = list(User.objects.all())
+
+        # One restriction of every type, all applying to the category.
+        holidays = [(horizon + datetime.timedelta(days=d)).isoformat() for d in range(0, 365, 30)]
+        restrictions = [
+            DateExclusionRestriction(name="blackout", parameters={"excluded_dates": holidays}),
+            AdjacentDayRestriction(name="bridges", parameters={"holidays": holidays}),
+            ConsecutiveDayRestriction(name="max streak", parameters={"max_consecutive_days": 10}),
+            CoworkerRestriction(name="minimum crew", parameters={"min_count": 5}),
+            DayOfWeekRestriction(name="weekdays", parameters={"allowed_days": [0, 1, 2, 3, 4]}),
+            PeriodLimitRestriction(name="weekly cap", parameters={"max_hours": 40, "period": "week"}),
+        ]
+        for restriction in restrictions:
+            restriction.save()
+            restriction.category.add(category)
+
+        # Existing leave every employee already has booked.
+        existing = []
+        for employee in employees:
+            begin = horizon + datetime.timedelta(days=rng.randrange(0, 300))
+            existing.append(Request(
+                employee=employee, category=category, title="existing", start_date=begin,
+                end_date=begin + datetime.timedelta(days=rng.randrange(0, 5)), hours_per_day=8,
+                status=rng.choice(['submitted', 'approved']),
+            ))
+        Request.objects.bulk_create(existing, batch_size=1000)
+        # bulk_create skips the signal handlers that maintain the derived tables.
+        rebuild_staffing()
+        rebuild_period_hours()
+
+        for size in options['sizes']:
+            # Candidates of one employee never overlap each other: full_clean()
+            # cannot see the rest of the batch, so the results would differ there.
+            candidates = []
+            booked = {}
+            while len(candidates) < size:
+                employee = rng.choice(employees)
+                begin = horizon + datetime.timedelta(days=rng.randrange(0, 365))
+                end = begin + datetime.timedelta(days=rng.randrange(0, 7))
+                if any(begin <= other_end and other_begin <= end for other_begin, other_end in booked.get(employee.pk, ())):
+                    continue
+                booked.setdefault(employee.pk, []).append((begin, end))
+                candidates.append(Request(
+                    employee=employee, category=category, title=f"candidate {len(candidates)}", start_date=begin,
+                    end_date=end, hours_per_day=8,
+                ))
+
+            with CaptureQueriesContext(connection) as queries:
+                began = time.perf_counter()
+                batch_errors = Request.validate_many(candidates)
+                elapsed = time.perf_counter() - began
+            failing = sum(1 for errors in batch_errors if errors)
+            self.stdout.write(
+                f"validate_many  n={size:6d}: {len(queries):7d} queries, {elapsed * 1000:9.1f} ms, {failing} failing"
+            )
+
+            if size > options['baseline_limit']:
+                self.stdout.write(f"full_clean()   n={size:6d}: skipped (above --baseline-limit)")
+                continue
+            with CaptureQueriesContext(connection) as queries:
+                began = time.perf_counter()
+                baseline_errors = []
+                for request_obj in candidates:
+                    try:
+                        request_obj.full_clean()
+                        baseline_errors.append([])
+                    except ValidationError as error:
+                        baseline_errors.append(error.messages)
+                elapsed = time.perf_counter() - began
+            baseline_failing = sum(1 for errors in baseline_errors if errors)
+            self.stdout.write(
+                f"full_clean()   n={size:6d}: {len(queries):7d} queries, {elapsed * 1000:9.1f} ms, {baseline_failing} failing"
+            )
+            differences = [
+                (index, sorted(batch), sorted(baseline))
+                for index, (batch, baseline) in enumerate(zip(batch_errors, baseline_errors))
+                if sorted(batch) != sorted(baseline)
+            ]
+            for index, batch, baseline in differences[:5]:
+                self.stdout.write(f"  candidate {index}: validate_many() {batch}, full_clean() {baseline}")
+            if differences:
+                raise CommandError(
+                    f"validate_many() and full_clean() disagree on {len(differences)} of {size} requests."
+                )
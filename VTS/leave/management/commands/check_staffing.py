@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from leave.aggregates import check_staffing
+
+
+class Command(BaseCommand):
+    help = "Compare location headcounts and the LocationDayStaffing table against the live data."
+
+    def handle(self, *args, **options):
+        mismatches = check_staffing()
+        for mismatch in mismatches:
+            self.stdout.write(mismatch)
+        if mismatches:
+            raise CommandError(f"{len(mismatches)} staffing mismatches found; run rebuild_staffing to repair them.")
+        self.stdout.write(self.style.SUCCESS("Staffing table is consistent."))
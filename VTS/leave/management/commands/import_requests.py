@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from leave.bulk_import import FIELDS, import_requests
+
+
+class Command(BaseCommand):
+    help = (
+        "Import leave requests from a CSV (with a header row) or JSON Lines file "
+        f"with the fields {', '.join(FIELDS)}. employee is a username and category "
+        "a category name; status defaults to approved. Rows are streamed, validated "
+        "and inserted in chunks; rejected rows are written to an error report. "
+        "An interrupted import resumes where it stopped when rerun."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to import.")
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help="Default: csv for *.csv files, jsonl otherwise.")
+        parser.add_argument('--chunk-size', type=int, default=2000, help="Rows validated and inserted per transaction.")
+        parser.add_argument('--skip-restrictions', action='store_true', help="Only check dates and overlaps (for historical records).")
+        parser.add_argument('--errors', help="Error report path (default: <path>.errors.csv).")
+        parser.add_argument('--restart', action='store_true', help="Start from the first row even if an earlier run was interrupted.")
+
+    def handle(self, *args, **options):
+        try:
+            imported, rejected = import_requests(
+                options['path'], fmt=options['format'], chunk_size=options['chunk_size'],
+                check_restrictions=not options['skip_restrictions'], error_path=options['errors'],
+                restart=options['restart'], stdout=self.stdout if options['verbosity'] > 1 else None,
+            )
+        except OSError as error:
+            raise CommandError(f"Cannot read {options['path']}: {error}")
+        message = f"Imported {imported} requests, rejected {rejected}."
+        if rejected:
+            message += f" See {options['errors'] or options['path'] + '.errors.csv'}."
+        self.stdout.write(self.style.SUCCESS(message))
@@ -0,0 +1,103 @@
+import os
+import tempfile
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, transaction
+
+from leave.management.benchmark import throwaway_database
+from leave.models import Category, Grant, User, UserLeaveBalance
+
+
+def naive_deduct(balance_id, hours):
+    """The original read-compare-write deduction from request_editor, kept for comparison."""
+    balance = UserLeaveBalance.objects.get(pk=balance_id)
+    if balance.remaining_hours < hours:
+        return False
+    balance.remaining_hours -= hours
+    balance.save()
+    return True
+
+
+def conditional_deduct(balance_id, hours):
+    with transaction.atomic():
+        return UserLeaveBalance.deduct(balance_id, hours)
+
+
+class Command(BaseCommand):
+    help = (
+        "Hammer one leave balance from many threads and report throughput and "
+        "lost updates for the original read-modify-write deduction and the "
+        "conditional UPDATE used by request_editor. Runs against a throwaway "
+        "file-based SQLite test database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--attempts', type=int, default=200, help="Deductions attempted per thread.")
+        parser.add_argument('--hours', type=int, default=8, help="Hours taken per deduction.")
+        parser.add_argument('--initial-hours', type=int, default=8000,
+                            help="Starting balance; keep it below threads x attempts x hours to exercise the limit.")
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as directory:
+            with throwaway_database(test_name=os.path.join(directory, 'loadtest.sqlite3')):
+                failures = []
+                for label, deduct in (("read-modify-write", naive_deduct), ("conditional UPDATE", conditional_deduct)):
+                    lost = self.run(label, deduct, options)
+                    if deduct is conditional_deduct and lost:
+                        failures.append(label)
+        if failures:
+            raise CommandError("The conditional deduction lost updates or overdrew the balance.")
+        self.stdout.write(self.style.SUCCESS("Conditional deduction: zero lost updates, balance never negative."))
+
+    def run(self, label, deduct, options):
+        category = Category.objects.create(name=f"load test {label}")
+        Grant.objects.create(employee_category='employee', category=category, allocated_hours=options['initial_hours'])
+        user = User.objects.create(username=f"loadtest-{label}")
+        # Creating the user already provisions the balance from the Grant (leave.signals).
+        balance, _ = UserLeaveBalance.objects.get_or_create(user=user, category=category)
+        UserLeaveBalance.objects.filter(pk=balance.pk).update(remaining_hours=options['initial_hours'])
+        # Close the main thread's connection so the workers are the only writers.
+        connection.close()
+
+        successes = []
+        errors = []
+        lock = threading.Lock()
+        start = threading.Barrier(options['threads'])
+
+        def worker():
+            done = failed = 0
+            start.wait()
+            try:
+                for _ in range(options['attempts']):
+                    try:
+                        if deduct(balance.pk, options['hours']):
+                            done += 1
+                    except OperationalError:
+                        failed += 1
+            finally:
+                connection.close()
+            with lock:
+                successes.append(done)
+                errors.append(failed)
+
+        threads = [threading.Thread(target=worker) for _ in range(options['threads'])]
+        began = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - began
+
+        final = UserLeaveBalance.objects.get(pk=balance.pk).remaining_hours
+        expected = options['initial_hours'] - sum(successes) * options['hours']
+        attempts = options['threads'] * options['attempts']
+        lost_updates = (final - expected) // options['hours']
+        self.stdout.write(
+            f"{label:>18}: {attempts / elapsed:8.0f} attempts/s, {sum(successes)} deductions, "
+            f"{sum(errors)} lock errors, final balance {final} (expected {expected}), "
+            f"{lost_updates} lost updates"
+        )
+        return lost_updates != 0 or final < 0
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from leave.models import Grant
+from leave.provisioning import provision_balances
+
+
+class Command(BaseCommand):
+    help = "Create every missing UserLeaveBalance covered by a Grant, in bulk."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--role', help="Only provision grants for this employee category (role).")
+        parser.add_argument('--category', type=int, help="Only provision grants for this category id.")
+        parser.add_argument('--chunk-size', type=int, default=1000, help="Balances inserted per transaction.")
+
+    def handle(self, *args, **options):
+        grants = Grant.objects.all()
+        if options['role']:
+            grants = grants.filter(employee_category=options['role'])
+        if options['category']:
+            grants = grants.filter(category_id=options['category'])
+        created = provision_balances(grants, chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f"Provisioned {created} leave balances."))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from leave.aggregates import rebuild_period_hours
+
+
+class Command(BaseCommand):
+    help = "Rebuild the EmployeePeriodHours ledger from the active requests in the Request table."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=2000, help="Requests fetched per database round trip.")
+
+    def handle(self, *args, **options):
+        rebuild_period_hours(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS("Period hours ledger rebuilt."))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from leave.aggregates import rebuild_staffing
+
+
+class Command(BaseCommand):
+    help = "Rebuild location headcounts and the LocationDayStaffing table from the Request table."
+
+    def handle(self, *args, **options):
+        rebuild_staffing(stdout=self.stdout if options['verbosity'] > 1 else None)
+        self.stdout.write(self.style.SUCCESS("Staffing table rebuilt."))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from leave.aggregates import rebuild_utilization
+
+
+class Command(BaseCommand):
+    help = "Rebuild the UtilizationRollup table from the active requests in the Request table."
+
+    def handle(self, *args, **options):
+        rebuild_utilization(stdout=self.stdout if options['verbosity'] > 1 else None)
+        self.stdout.write(self.style.SUCCESS("Utilization rollup rebuilt."))
@@ -0,0 +1,142 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from leave.models import LeaveBalanceSnapshot, LeaveLedgerEntry, UserLeaveBalance
+
+
+def _latest_snapshots():
+    return LeaveBalanceSnapshot.objects.filter(
+        user_id=OuterRef('user_id'), category_id=OuterRef('category_id'),
+    ).order_by('-last_entry_id')
+
+
+def _ledger_totals(chunk_size, full=False):
+    """
+    Yield ((user_id, category_id), balance, last_entry_id, snapshot_entry_id)
+    from the ledger, one pair at a time. Unless full, each pair starts from
+    its latest snapshot and only the entries after it are read;
+    snapshot_entry_id is that snapshot's last_entry_id (None without one).
+    """
+    entries = LeaveLedgerEntry.objects.all()
+    snapshots = iter(())
+    if not full:
+        entries = entries.filter(id__gt=Coalesce(Subquery(_latest_snapshots().values('last_entry_id')[:1]), 0))
+        snapshots = LeaveBalanceSnapshot.objects.filter(
+            ~Exists(_latest_snapshots().filter(last_entry_id__gt=OuterRef('last_entry_id')))
+        ).order_by('user_id', 'category_id').values_list(
+            'user_id', 'category_id', 'balance', 'last_entry_id'
+        ).iterator(chunk_size=chunk_size)
+    entries = entries.order_by('user_id', 'category_id', 'id').values_list('user_id', 'category_id', 'id', 'hours')
+
+    def tails():
+        key, total, last_id = None, 0.0, None
+        for user_id, category_id, entry_id, hours in entries.iterator(chunk_size=chunk_size):
+            if (user_id, category_id) != key:
+                if key is not None:
+                    yield key, total, last_id
+                key, total = (user_id, category_id), 0.0
+            total += hours
+            last_id = entry_id
+        if key is not None:
+            yield key, total, last_id
+
+    # Merge the snapshots with the entries after them, both ordered by pair.
+    tail_stream = tails()
+    tail = next(tail_stream, None)
+    snapshot = next(snapshots, None)
+    while tail is not None or snapshot is not None:
+        snapshot_key = snapshot[:2] if snapshot is not None else None
+        if snapshot is None or (tail is not None and tail[0] < snapshot_key):
+            yield tail + (None,)
+            tail = next(tail_stream, None)
+        elif tail is None or snapshot_key < tail[0]:
+            yield snapshot_key, snapshot[2], snapshot[3], snapshot[3]
+            snapshot = next(snapshots, None)
+        else:
+            yield snapshot_key, snapshot[2] + tail[1], tail[2], snapshot[3]
+            tail = next(tail_stream, None)
+            snapshot = next(snapshots, None)
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute every (user, category) balance from its latest snapshot plus "
+        "the leave ledger entries after it, streamed in chunks, and compare it "
+        "with UserLeaveBalance.remaining_hours. Optionally repair mismatches "
+        "and write new balance snapshots."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5000, help="Rows fetched per database round trip.")
+        parser.add_argument('--fix', action='store_true', help="Set remaining_hours to the ledger balance where they differ.")
+        parser.add_argument(
+            '--snapshot', action='store_true',
+            help="Write a LeaveBalanceSnapshot for every pair with new entries and drop the ones it replaces.",
+        )
+        parser.add_argument('--full', action='store_true', help="Ignore the snapshots and sum each pair's whole ledger.")
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        balances = UserLeaveBalance.objects.order_by('user_id', 'category_id').values_list(
+            'id', 'user_id', 'category_id', 'remaining_hours'
+        ).iterator(chunk_size=chunk_size)
+        ledger = _ledger_totals(chunk_size, full=options['full'])
+
+        mismatches = 0
+        fixes = []
+        snapshots = []
+
+        def flush():
+            with transaction.atomic():
+                if fixes:
+                    UserLeaveBalance.objects.bulk_update(fixes, ['remaining_hours'])
+                if snapshots:
+                    LeaveBalanceSnapshot.objects.bulk_create(snapshots)
+            fixes.clear()
+            snapshots.clear()
+
+        # Merge-join the two streams, both ordered by (user_id, category_id).
+        balance = next(balances, None)
+        entry = next(ledger, None)
+        while balance is not None or entry is not None:
+            balance_key = balance[1:3] if balance is not None else None
+            entry_key = entry[0] if entry is not None else None
+            if entry is None or (balance is not None and balance_key < entry_key):
+                expected, last_entry_id, snapshot_entry_id = 0.0, None, None
+                current = balance
+                balance = next(balances, None)
+            elif balance is None or entry_key < balance_key:
+                self.stdout.write(f"User {entry_key[0]}, category {entry_key[1]}: ledger entries but no balance row.")
+                mismatches += 1
+                entry = next(ledger, None)
+                continue
+            else:
+                _, expected, last_entry_id, snapshot_entry_id = entry
+                current = balance
+                balance = next(balances, None)
+                entry = next(ledger, None)
+
+            balance_id, user_id, category_id, remaining = current
+            if remaining is None or abs(remaining - expected) > 1e-6:
+                mismatches += 1
+                self.stdout.write(f"User {user_id}, category {category_id}: remaining {remaining}, ledger {expected:g}.")
+                if options['fix']:
+                    fixes.append(UserLeaveBalance(id=balance_id, remaining_hours=expected))
+            if options['snapshot'] and last_entry_id not in (None, snapshot_entry_id):
+                snapshots.append(LeaveBalanceSnapshot(
+                    user_id=user_id, category_id=category_id, last_entry_id=last_entry_id, balance=expected,
+                ))
+            if len(fixes) + len(snapshots) >= chunk_size:
+                flush()
+        flush()
+        if options['snapshot']:
+            # Only the latest snapshot of a pair is ever read.
+            LeaveBalanceSnapshot.objects.filter(
+                Exists(_latest_snapshots().filter(last_entry_id__gt=OuterRef('last_entry_id')))
+            ).delete()
+
+        if mismatches and not options['fix']:
+            raise CommandError(f"{mismatches} balances disagree with the ledger; rerun with --fix to repair them.")
+        self.stdout.write(self.style.SUCCESS(f"Ledger reconciled ({mismatches} mismatches)."))
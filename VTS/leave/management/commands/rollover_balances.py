@@ -0,0 +1,31 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from leave.accrual import run_rollover
+
+
+class Command(BaseCommand):
+    help = (
+        "Start a new leave year: carry over unused hours up to each grant's "
+        "max_carryover_hours, allocate the grant's hours again and expire "
+        "grants past their expiration_date. Resumable; safe to rerun."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--year', type=int, help="Leave year to roll into (default: the current year).")
+        parser.add_argument('--as-of', help="Expire grants whose expiration_date is on or before this date, YYYY-MM-DD (default: today).")
+        parser.add_argument('--chunk-size', type=int, default=2000, help="Balances read and written per transaction.")
+        parser.add_argument('--restart', action='store_true', help="Start from the beginning even if an earlier run for this year was interrupted.")
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+        year = options['year'] or today.year
+        try:
+            as_of = datetime.date.fromisoformat(options['as_of']) if options['as_of'] else today
+        except ValueError:
+            raise CommandError("--as-of must be a date in YYYY-MM-DD format.")
+        stdout = self.stdout if options['verbosity'] > 1 else None
+        changed = run_rollover(year, as_of, chunk_size=options['chunk_size'], restart=options['restart'], stdout=stdout)
+        self.stdout.write(self.style.SUCCESS(f"Rolled {changed} balances into {year}."))
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from leave.outbox import DEFAULT_MAX_ATTEMPTS, drain
+
+
+class Command(BaseCommand):
+    help = (
+        "Deliver queued notification emails from the outbox in batches over "
+        "one mail connection, retrying failures with backoff."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help="Emails claimed and sent per batch.")
+        parser.add_argument('--max-attempts', type=int, default=DEFAULT_MAX_ATTEMPTS, help="Failures before an email is marked dead.")
+        parser.add_argument('--loop', action='store_true', help="Keep running, polling the outbox every --interval seconds.")
+        parser.add_argument('--interval', type=float, default=10, help="Seconds between polls with --loop.")
+
+    def handle(self, *args, **options):
+        stdout = self.stdout if options['verbosity'] > 1 else None
+        while True:
+            sent, failed = drain(options['batch_size'], options['max_attempts'], stdout=stdout)
+            if sent or failed or not options['loop']:
+                self.stdout.write(f"Outbox: {sent} sent, {failed} failed.")
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
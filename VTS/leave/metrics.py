@@ -0,0 +1,130 @@
+"""
+In-process metrics for restriction validation, exposed in the Prometheus
+text exposition format by the metrics_endpoint view.
+
+Every Restriction.validate() call made by Request.clean() and
+Request.validate_many() goes through timed_validate(), which records a
+duration histogram, the number of SQL queries issued and pass/fail
+counters per restriction class. Validations slower than
+LEAVE_SLOW_VALIDATION_SECONDS are logged (sampled by
+LEAVE_SLOW_VALIDATION_SAMPLE_RATE) to the 'leave.metrics' logger.
+
+Metrics are per process; with several workers, scrape each one. The
+endpoint only answers staff users, requests carrying LEAVE_METRICS_TOKEN
+as a bearer token and any addresses listed in LEAVE_METRICS_ALLOWED_IPS
+(empty by default; see may_scrape()).
+"""
+import logging
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+from django.utils.crypto import constant_time_compare
+
+logger = logging.getLogger('leave.metrics')
+
+# Upper bounds (seconds) of the duration histogram buckets.
+DURATION_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+_lock = threading.Lock()
+_durations = {}  # restriction class -> [bucket counts..., +Inf count]
+_duration_sums = {}
+_queries = {}
+_outcomes = {}  # (restriction class, 'pass' | 'fail') -> count
+
+
+class _QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def timed_validate(restriction, request_obj, context=None):
+    """Run restriction.validate() and record its duration, queries and outcome."""
+    counter = _QueryCounter()
+    began = time.perf_counter()
+    with connection.execute_wrapper(counter):
+        result = restriction.validate(request_obj, context)
+    elapsed = time.perf_counter() - began
+    observe_validation(restriction, request_obj, elapsed, counter.count, result.validated())
+    return result
+
+
+def observe_validation(restriction, request_obj, seconds, queries, passed):
+    name = restriction.__class__.__name__
+    with _lock:
+        buckets = _durations.setdefault(name, [0] * (len(DURATION_BUCKETS) + 1))
+        for index, bound in enumerate(DURATION_BUCKETS):
+            if seconds <= bound:
+                buckets[index] += 1
+                break
+        else:
+            buckets[-1] += 1
+        _duration_sums[name] = _duration_sums.get(name, 0.0) + seconds
+        _queries[name] = _queries.get(name, 0) + queries
+        outcome = (name, 'pass' if passed else 'fail')
+        _outcomes[outcome] = _outcomes.get(outcome, 0) + 1
+
+    threshold = getattr(settings, 'LEAVE_SLOW_VALIDATION_SECONDS', 0.05)
+    sample_rate = getattr(settings, 'LEAVE_SLOW_VALIDATION_SAMPLE_RATE', 0.1)
+    if seconds >= threshold and random.random() < sample_rate:
+        logger.warning(
+            "Slow validation: %s id=%s took %.1f ms (%d queries) for request id=%s %s..%s",
+            name, restriction.pk, seconds * 1000, queries,
+            request_obj.pk, request_obj.start_date, request_obj.end_date,
+        )
+
+
+def may_scrape(request):
+    """Whether the request may read the metrics endpoint."""
+    token = getattr(settings, 'LEAVE_METRICS_TOKEN', None)
+    if token:
+        scheme, _, credentials = request.headers.get('Authorization', '').partition(' ')
+        if scheme.lower() == 'bearer' and constant_time_compare(credentials.strip(), token):
+            return True
+    if request.META.get('REMOTE_ADDR') in getattr(settings, 'LEAVE_METRICS_ALLOWED_IPS', ()):
+        return True
+    return request.user.is_authenticated and request.user.is_staff
+
+
+def render_prometheus():
+    """Return all metrics in the Prometheus text exposition format (version 0.0.4)."""
+    with _lock:
+        durations = {name: list(buckets) for name, buckets in _durations.items()}
+        duration_sums = dict(_duration_sums)
+        queries = dict(_queries)
+        outcomes = dict(_outcomes)
+
+    lines = [
+        "# HELP leave_restriction_validation_seconds Time spent in Restriction.validate().",
+        "# TYPE leave_restriction_validation_seconds histogram",
+    ]
+    for name in sorted(durations):
+        cumulative = 0
+        for bound, count in zip(DURATION_BUCKETS, durations[name]):
+            cumulative += count
+            lines.append(f'leave_restriction_validation_seconds_bucket{{restriction="{name}",le="{bound}"}} {cumulative}')
+        cumulative += durations[name][-1]
+        lines.append(f'leave_restriction_validation_seconds_bucket{{restriction="{name}",le="+Inf"}} {cumulative}')
+        lines.append(f'leave_restriction_validation_seconds_sum{{restriction="{name}"}} {duration_sums[name]:.6f}')
+        lines.append(f'leave_restriction_validation_seconds_count{{restriction="{name}"}} {cumulative}')
+
+    lines += [
+        "# HELP leave_restriction_queries_total SQL queries issued inside Restriction.validate().",
+        "# TYPE leave_restriction_queries_total counter",
+    ]
+    for name in sorted(queries):
+        lines.append(f'leave_restriction_queries_total{{restriction="{name}"}} {queries[name]}')
+
+    lines += [
+        "# HELP leave_restriction_validations_total Restriction.validate() calls by outcome.",
+        "# TYPE leave_restriction_validations_total counter",
+    ]
+    for name, outcome in sorted(outcomes):
+        lines.append(f'leave_restriction_validations_total{{restriction="{name}",outcome="{outcome}"}} {outcomes[(name, outcome)]}')
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,100 @@
+# Generated by Django 5.1.7 on 2026-10-18 20:27
+
+import datetime
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_on_leave_by_day(intervals, window_start, window_end):
+    """
+    Copy of leave.models.count_on_leave_by_day as of this migration.
+
+    Sweep (employee_id, start_date, end_date) intervals into a list holding,
+    for each day from window_start to window_end, the number of distinct
+    employees on leave that day. Overlapping intervals of one employee are
+    merged first so nobody is counted twice.
+    """
+    by_employee = {}
+    for employee_id, start_date, end_date in intervals:
+        start_date = max(start_date, window_start)
+        end_date = min(end_date, window_end)
+        if start_date <= end_date:
+            by_employee.setdefault(employee_id, []).append((start_date, end_date))
+
+    num_days = (window_end - window_start).days + 1
+    # Difference array: +1 on the first day of a merged interval, -1 after its last day.
+    deltas = [0] * (num_days + 1)
+    for spans in by_employee.values():
+        spans.sort()
+        merged_start, merged_end = spans[0]
+        for start_date, end_date in spans[1:]:
+            if start_date <= merged_end + datetime.timedelta(days=1):
+                merged_end = max(merged_end, end_date)
+                continue
+            deltas[(merged_start - window_start).days] += 1
+            deltas[(merged_end - window_start).days + 1] -= 1
+            merged_start, merged_end = start_date, end_date
+        deltas[(merged_start - window_start).days] += 1
+        deltas[(merged_end - window_start).days + 1] -= 1
+
+    counts = []
+    running = 0
+    for delta in deltas[:num_days]:
+        running += delta
+        counts.append(running)
+    return counts
+
+
+def backfill_staffing(apps, schema_editor):
+    Location = apps.get_model('leave', 'Location')
+    LocationDayStaffing = apps.get_model('leave', 'LocationDayStaffing')
+    Request = apps.get_model('leave', 'Request')
+    for location in Location.objects.annotate(employee_count=Count('employees')):
+        location.headcount = location.employee_count
+        location.save(update_fields=['headcount'])
+        intervals = list(Request.objects.filter(
+            employee__location=location, status__in=['submitted', 'approved']
+        ).values_list('employee_id', 'start_date', 'end_date'))
+        if not intervals:
+            continue
+        window_start = min(start for _, start, _ in intervals)
+        window_end = max(end for _, _, end in intervals)
+        counts = count_on_leave_by_day(intervals, window_start, window_end)
+        LocationDayStaffing.objects.bulk_create(
+            [
+                LocationDayStaffing(location=location, date=window_start + datetime.timedelta(days=offset), on_leave_count=count)
+                for offset, count in enumerate(counts)
+                if count
+            ],
+            batch_size=1000,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leave', '0004_remove_request_grant_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='location',
+            name='headcount',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.CreateModel(
+            name='LocationDayStaffing',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('on_leave_count', models.IntegerField(default=0)),
+                ('location', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_staffing', to='leave.location')),
+            ],
+            options={
+                'unique_together': {('location', 'date')},
+            },
+        ),
+        migrations.RunPython(backfill_staffing, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,85 @@
+# Generated by Django 5.1.7 on 2026-10-18 20:29
+
+import datetime
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def period_start_for(date, period):
+    if period == 'week':
+        return date - datetime.timedelta(days=date.weekday())
+    return date.replace(day=1)
+
+
+def next_period_start(period_start, period):
+    if period == 'week':
+        return period_start + datetime.timedelta(days=7)
+    if period_start.month == 12:
+        return period_start.replace(year=period_start.year + 1, month=1)
+    return period_start.replace(month=period_start.month + 1)
+
+
+def split_hours_by_period(start_date, end_date, hours_per_day, period):
+    """
+    Copy of leave.models.split_hours_by_period as of this migration.
+
+    Split the hours of a leave span into {period_start: hours} for every
+    week or month it touches. Works per period, not per day.
+    """
+    hours = {}
+    period_start = period_start_for(start_date, period)
+    while period_start <= end_date:
+        following = next_period_start(period_start, period)
+        first_day = max(start_date, period_start)
+        last_day = min(end_date, following - datetime.timedelta(days=1))
+        hours[period_start] = ((last_day - first_day).days + 1) * hours_per_day
+        period_start = following
+    return hours
+
+
+def backfill_period_hours(apps, schema_editor):
+    EmployeePeriodHours = apps.get_model('leave', 'EmployeePeriodHours')
+    Request = apps.get_model('leave', 'Request')
+    totals = {}
+    active = Request.objects.filter(status__in=['submitted', 'approved']).values_list(
+        'employee_id', 'category_id', 'start_date', 'end_date', 'hours_per_day'
+    )
+    for employee_id, category_id, start_date, end_date, hours_per_day in active.iterator():
+        for period in ('week', 'month'):
+            for period_start, hours in split_hours_by_period(start_date, end_date, hours_per_day, period).items():
+                key = (employee_id, category_id, period, period_start)
+                totals[key] = totals.get(key, 0) + hours
+    EmployeePeriodHours.objects.bulk_create(
+        [
+            EmployeePeriodHours(employee_id=employee_id, category_id=category_id, period=period, period_start=period_start, hours=hours)
+            for (employee_id, category_id, period, period_start), hours in totals.items()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leave', '0005_locationdaystaffing'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmployeePeriodHours',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('week', 'ISO Week'), ('month', 'Calendar Month')], max_length=10)),
+                ('period_start', models.DateField()),
+                ('hours', models.FloatField(default=0)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='period_hours', to='leave.category')),
+                ('employee', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='period_hours', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('employee', 'category', 'period', 'period_start')},
+            },
+        ),
+        migrations.RunPython(backfill_period_hours, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.1.7 on 2026-10-18 20:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leave', '0006_employeeperiodhours'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='request',
+            index=models.Index(fields=['employee', 'start_date', 'end_date'], name='request_employee_dates_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='request',
+            index=models.Index(fields=['employee', 'status'], name='request_employee_status_idx'),
+        ),
+    ]
@@ -0,0 +1,81 @@
+# Generated by Django 5.1.7 on 2026-10-18 20:37
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def open_ledger(apps, schema_editor):
+    # One opening grant per existing balance, a debit linked to each
+    # submitted or approved request (so withdrawing or editing it later
+    # refunds or rebooks the right hours), and an unlinked entry for
+    # whatever difference is left, so the ledger starts out agreeing with
+    # remaining_hours.
+    UserLeaveBalance = apps.get_model('leave', 'UserLeaveBalance')
+    LeaveLedgerEntry = apps.get_model('leave', 'LeaveLedgerEntry')
+    Request = apps.get_model('leave', 'Request')
+    debits = {}
+    for request_id, user_id, category_id, start_date, end_date, hours_per_day in Request.objects.filter(
+        status__in=['submitted', 'approved']
+    ).values_list('id', 'employee_id', 'category_id', 'start_date', 'end_date', 'hours_per_day').iterator():
+        hours = (abs((end_date - start_date).days) + 1) * hours_per_day
+        debits.setdefault((user_id, category_id), []).append((request_id, hours))
+
+    entries = []
+    for user_id, category_id, allocated, remaining in UserLeaveBalance.objects.values_list(
+        'user_id', 'category_id', 'allocated_hours', 'remaining_hours'
+    ).iterator():
+        allocated = allocated or 0
+        remaining = remaining if remaining is not None else allocated
+        entries.append(LeaveLedgerEntry(user_id=user_id, category_id=category_id, kind='grant', hours=allocated))
+        leftover = remaining - allocated
+        for request_id, hours in debits.get((user_id, category_id), ()):
+            entries.append(LeaveLedgerEntry(
+                user_id=user_id, category_id=category_id, kind='debit', hours=-hours, request_id=request_id,
+            ))
+            leftover += hours
+        if leftover < 0:
+            entries.append(LeaveLedgerEntry(user_id=user_id, category_id=category_id, kind='debit', hours=leftover))
+        elif leftover > 0:
+            # The requests add up to more than was ever deducted.
+            entries.append(LeaveLedgerEntry(user_id=user_id, category_id=category_id, kind='refund', hours=leftover))
+    LeaveLedgerEntry.objects.bulk_create(entries, batch_size=1000)
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leave', '0007_request_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeaveBalanceSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_entry_id', models.BigIntegerField()),
+                ('balance', models.FloatField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balance_snapshots', to='leave.category')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balance_snapshots', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'category', 'last_entry_id'], name='snapshot_user_category_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='LeaveLedgerEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('grant', 'Grant'), ('debit', 'Debit'), ('refund', 'Refund'), ('expiry', 'Expiry')], max_length=10)),
+                ('hours', models.FloatField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ledger_entries', to='leave.category')),
+                ('request', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ledger_entries', to='leave.request')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ledger_entries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'category', 'id'], name='ledger_user_category_idx')],
+            },
+        ),
+        migrations.RunPython(open_ledger, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.1.7 on 2026-10-18 20:41
+
+import leave.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leave', '0008_leave_ledger'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JobCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('position', models.BigIntegerField(default=0)),
+                ('finished', models.BooleanField(default=False)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='grant',
+            name='max_carryover_hours',
+            field=models.IntegerField(blank=True, help_text='Unused hours that roll over into the next leave year. Leave blank for no limit.', null=True),
+        ),
+        migrations.AddField(
+            model_name='userleavebalance',
+            name='period_year',
+            field=models.IntegerField(default=leave.models.current_leave_year),
+        ),
+    ]
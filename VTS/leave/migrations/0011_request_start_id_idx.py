@@ -0,0 +1,17 @@
+# Generated by Django 5.1.7 on 2026-10-18 20:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leave', '0010_outboxemail'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='request',
+            index=models.Index(fields=['start_date', 'id'], name='request_start_id_idx'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.1.7 on 2026-10-18 21:05
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leave', '0011_request_start_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='request',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+    ]
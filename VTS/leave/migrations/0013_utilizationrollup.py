@@ -0,0 +1,85 @@
+# Generated by Django 5.1.7 on 2026-10-18 21:09
+
+import datetime
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import ExpressionWrapper, F, FloatField, Func, IntegerField, Max, Min, Q, Sum, Value
+from django.db.models.functions import Greatest, Least
+
+
+class DaysBetween(Func):
+    """Copy of leave.aggregates.DaysBetween as of this migration."""
+    arity = 2
+    arg_joiner = ' - '
+    template = '(%(expressions)s)'
+    output_field = IntegerField()
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self.as_sql(
+            compiler, connection,
+            template='CAST(JULIANDAY(%(expressions)s) AS INTEGER)', arg_joiner=') - JULIANDAY(',
+            **extra_context,
+        )
+
+    def as_mysql(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, function='DATEDIFF', template='%(function)s(%(expressions)s)', arg_joiner=', ', **extra_context)
+
+
+def backfill_utilization(apps, schema_editor):
+    """One grouped query per month, as in leave.aggregates.rebuild_utilization()."""
+    Request = apps.get_model('leave', 'Request')
+    UtilizationRollup = apps.get_model('leave', 'UtilizationRollup')
+    active = Request.objects.filter(status__in=['submitted', 'approved'])
+    span = active.aggregate(first=Min('start_date'), last=Max('end_date'))
+    if span['first'] is None:
+        return
+    month = span['first'].replace(day=1)
+    while month <= span['last']:
+        following = (month + datetime.timedelta(days=32)).replace(day=1)
+        month_end = following - datetime.timedelta(days=1)
+        days = DaysBetween(Least('end_date', Value(month_end)), Greatest('start_date', Value(month))) + 1
+        hours = ExpressionWrapper(days * F('hours_per_day'), output_field=FloatField())
+        rows = active.filter(
+            start_date__lte=month_end, end_date__gte=month, employee__location__isnull=False,
+        ).values('category_id', location_id=F('employee__location_id')).annotate(
+            taken=Sum(hours, filter=Q(status='approved'), default=0),
+            pending=Sum(hours, filter=Q(status='submitted'), default=0),
+        ).order_by()
+        UtilizationRollup.objects.bulk_create(
+            [
+                UtilizationRollup(
+                    category_id=row['category_id'], location_id=row['location_id'], month=month,
+                    taken_hours=row['taken'], pending_hours=row['pending'],
+                )
+                for row in rows
+            ],
+            batch_size=1000,
+        )
+        month = following
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leave', '0012_request_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UtilizationRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('taken_hours', models.FloatField(default=0)),
+                ('pending_hours', models.FloatField(default=0)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='utilization', to='leave.category')),
+                ('location', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='utilization', to='leave.location')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['month'], name='utilization_month_idx')],
+                'unique_together': {('category', 'location', 'month')},
+            },
+        ),
+        migrations.RunPython(backfill_utilization, migrations.RunPython.noop),
+    ]
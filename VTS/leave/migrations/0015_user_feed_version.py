@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-18 21:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leave', '0013_utilizationrollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='feed_version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
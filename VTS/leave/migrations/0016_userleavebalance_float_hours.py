@@ -0,0 +1,23 @@
+# Generated by Django 5.1.7 on 2026-10-18 21:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leave', '0015_user_feed_version'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='userleavebalance',
+            name='allocated_hours',
+            field=models.FloatField(blank=True, help_text='Total allocated leave hours for this category.', null=True),
+        ),
+        migrations.AlterField(
+            model_name='userleavebalance',
+            name='remaining_hours',
+            field=models.FloatField(blank=True, help_text='Remaining leave hours for this category.', null=True),
+        ),
+    ]
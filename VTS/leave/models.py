@@ -1,9 +1,17 @@
-from django.db import models
+from django.db import connection, models, transaction
+from django.db.models import DEFERRED, F, Q, Sum
 from django.contrib.auth.models import AbstractUser
+from django.core.cache import cache
 from django.utils import timezone
+from django.utils.functional import cached_property
+import bisect
 import datetime
+import uuid
+from collections import namedtuple
 from django.core.exceptions import ValidationError
 
+from . import metrics
+
 
 # ---------------------------
 # Custom User Model (Employee)
@@ -20,7 +28,16 @@ class User(AbstractUser):
     location = models.ForeignKey('Location', on_delete=models.SET_NULL, null=True, blank=True, related_name='employees')
     # Self-association to denote manager-subordinate relationships.
     managers = models.ManyToManyField('self', symmetrical=False, related_name='subordinates', blank=True)
+    # Signed into the user's calendar feed URLs (see leave.feeds); bumping it revokes them.
+    feed_version = models.PositiveIntegerField(default=0, editable=False)
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the loaded location so signal handlers can tell when it changes.
+        instance._loaded_location_id = instance.__dict__.get('location_id', DEFERRED)
+        return instance
+
     def __str__(self):
         return self.username
 
@@ -30,6 +47,8 @@ class User(AbstractUser):
 class Location(models.Model):
     name = models.CharField(max_length=255)
     address = models.TextField(blank=True, null=True)  # Optional address field.
+    # Number of employees at this location, maintained by leave.signals.
+    headcount = models.IntegerField(default=0, editable=False)
     
     def __str__(self):
         return self.name
@@ -54,22 +73,120 @@ class Grant(models.Model):
     category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='grants')
     allocated_hours = models.IntegerField()  # Total hours available for this grant.
     expiration_date = models.DateField(blank=True, null=True)
-    
+    max_carryover_hours = models.IntegerField(
+        blank=True, null=True,
+        help_text="Unused hours that roll over into the next leave year. Leave blank for no limit."
+    )
+
     def __str__(self):
-        return f"{self.employee_category} - {self.category.name} Grant"
+        # Use the category if it is already loaded, otherwise the cached
+        # name, so listing grants does not cost a query per row.
+        if Grant.category.is_cached(self):
+            category_name = self.category.name
+        else:
+            category_name = get_grant_category_name(self.category_id)
+            if category_name is None:
+                category_name = self.category.name
+        return f"{self.employee_category} - {category_name} Grant"
+
+
+# ---------------------------
+# Grant cache
+# The Grant table is tiny and rarely changes, so each process keeps all of
+# it in memory keyed by (role, category_id). Grant and Category changes
+# bump a version token in Django's cache (see leave.signals); every process
+# compares its copy against that token and reloads when it is stale. Use a
+# shared cache backend (e.g., Memcached or Redis) when running several
+# worker processes.
+# ---------------------------
+GRANT_CACHE_VERSION_KEY = 'leave:grant-cache-version'
+
+_grant_cache = {'version': None, 'grants': {}, 'category_names': {}}
+
+
+def _shared_cache_version(key):
+    """Return the version token stored under key in Django's cache, creating one if needed."""
+    version = cache.get(key)
+    if version is None:
+        # Evicted or never set: start a new version so every process reloads.
+        cache.add(key, uuid.uuid4().hex, None)
+        version = cache.get(key)
+    return version
+
+
+def _awaiting_commit(callback):
+    """
+    Whether callback is queued to run when the open transaction commits,
+    i.e., the transaction made changes that a rollback could still undo.
+    Django drops the callbacks of a rolled-back savepoint, so this clears
+    itself on rollback as well as on commit.
+    """
+    return connection.in_atomic_block and any(func is callback for _, func, _ in connection.run_on_commit)
+
+
+def _fetch_grants():
+    grants = {}
+    category_names = {}
+    for grant in Grant.objects.select_related('category').order_by('id'):
+        # Like the old .get() lookups, the first grant for a pair wins.
+        grants.setdefault((grant.employee_category, grant.category_id), grant)
+        category_names[grant.category_id] = grant.category.name
+    return {'grants': grants, 'category_names': category_names}
+
+
+def _load_grant_cache():
+    if _awaiting_commit(invalidate_grant_cache):
+        # Grants changed in the open transaction: hand back a fresh copy
+        # without caching it, so a rollback cannot leave it behind.
+        return _fetch_grants()
+    version = _shared_cache_version(GRANT_CACHE_VERSION_KEY)
+    if version is None or version != _grant_cache['version']:
+        _grant_cache.update(version=version, **_fetch_grants())
+    return _grant_cache
+
+
+def get_grant(role, category_id):
+    """Return the Grant for a role and category, or None if there is none."""
+    return _load_grant_cache()['grants'].get((role, category_id))
+
+
+def get_grants_for_role(role):
+    """Return {category_id: Grant} for every category the role is granted."""
+    return {
+        category_id: grant
+        for (grant_role, category_id), grant in _load_grant_cache()['grants'].items()
+        if grant_role == role
+    }
+
+
+def get_grant_category_name(category_id):
+    return _load_grant_cache()['category_names'].get(category_id)
+
+
+def invalidate_grant_cache():
+    """Drop this process's copy and tell every other process to reload theirs."""
+    _grant_cache.update(version=None, grants={}, category_names={})
+    cache.set(GRANT_CACHE_VERSION_KEY, uuid.uuid4().hex, None)
+
+
+def current_leave_year():
+    return timezone.localdate().year
 
 
 class UserLeaveBalance(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='leave_balances')
     category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='user_leave_balances')
-    allocated_hours = models.IntegerField(
+    # Floats, like LeaveLedgerEntry.hours: part days deduct fractional hours.
+    allocated_hours = models.FloatField(
         help_text="Total allocated leave hours for this category.",
         blank=True, null=True  # Allow blank initially; will be set in save()
     )
-    remaining_hours = models.IntegerField(
+    remaining_hours = models.FloatField(
         help_text="Remaining leave hours for this category.",
         blank=True, null=True  # Allow blank initially; will be set in save()
     )
+    # Leave year the allocation belongs to; the rollover_balances command moves it forward.
+    period_year = models.IntegerField(default=current_leave_year)
 
     class Meta:
         unique_together = ('user', 'category')
@@ -78,24 +195,256 @@ class UserLeaveBalance(models.Model):
         # When creating a new UserLeaveBalance, if the balance is not yet set,
         # look up the matching Grant based on the user's role and the category.
         if self.pk is None:
-            try:
-                grant = Grant.objects.get(employee_category=self.user.role, category=self.category)
-            except Grant.DoesNotExist:
+            grant = get_grant(self.user.role, self.category_id)
+            if grant is None:
                 raise ValueError("No grant exists for this user and category. Please contact HR.")
             # Set the allocated and remaining hours from the Grant.
             self.allocated_hours = grant.allocated_hours
             self.remaining_hours = grant.allocated_hours
+            with transaction.atomic():
+                super().save(*args, **kwargs)
+                LeaveLedgerEntry.objects.create(user=self.user, category=self.category, kind='grant', hours=grant.allocated_hours)
+            return
         super().save(*args, **kwargs)
 
+    @classmethod
+    def deduct(cls, balance_id, hours):
+        """
+        Take hours off a balance in a single conditional UPDATE, only if at
+        least that many remain. Returns True if the hours were deducted.
+        """
+        updated = cls.objects.filter(pk=balance_id, remaining_hours__gte=hours).update(
+            remaining_hours=F('remaining_hours') - hours
+        )
+        return updated == 1
+
+    @classmethod
+    def refund_request(cls, request_obj):
+        """
+        Give back whatever the ledger shows is still debited for a request
+        (e.g., after it is withdrawn, cancelled or rejected). Returns the
+        refunded hours.
+        """
+        net = LeaveLedgerEntry.objects.filter(request=request_obj).aggregate(net=Sum('hours'))['net'] or 0
+        if net >= 0:
+            return 0
+        with transaction.atomic():
+            cls.objects.filter(user_id=request_obj.employee_id, category_id=request_obj.category_id).update(
+                remaining_hours=F('remaining_hours') - net
+            )
+            LeaveLedgerEntry.objects.create(
+                user_id=request_obj.employee_id, category_id=request_obj.category_id,
+                kind='refund', hours=-net, request=request_obj,
+            )
+        return -net
+
+    @classmethod
+    def rebook_request(cls, request_obj, hours):
+        """
+        After an edit, make the ledger debit exactly `hours` for the request
+        in its current category: whatever is debited under another category
+        is refunded, and only the difference is deducted or refunded in the
+        current one. Call inside a transaction. Returns False, having
+        deducted nothing more, if the balance cannot cover the extra hours.
+        """
+        debited = dict(LeaveLedgerEntry.objects.filter(request=request_obj).values('category_id').annotate(
+            net=Sum('hours')
+        ).order_by().values_list('category_id', 'net'))
+        for category_id, net in debited.items():
+            if category_id != request_obj.category_id and net < 0:
+                cls.objects.filter(user_id=request_obj.employee_id, category_id=category_id).update(
+                    remaining_hours=F('remaining_hours') - net
+                )
+                LeaveLedgerEntry.objects.create(
+                    user_id=request_obj.employee_id, category_id=category_id,
+                    kind='refund', hours=-net, request=request_obj,
+                )
+        extra = hours + debited.get(request_obj.category_id, 0)
+        if extra > 0:
+            deducted = cls.objects.filter(
+                user_id=request_obj.employee_id, category_id=request_obj.category_id, remaining_hours__gte=extra
+            ).update(remaining_hours=F('remaining_hours') - extra)
+            if not deducted:
+                return False
+            LeaveLedgerEntry.objects.create(
+                user_id=request_obj.employee_id, category_id=request_obj.category_id,
+                kind='debit', hours=-extra, request=request_obj,
+            )
+        elif extra < 0:
+            cls.objects.filter(user_id=request_obj.employee_id, category_id=request_obj.category_id).update(
+                remaining_hours=F('remaining_hours') - extra
+            )
+            LeaveLedgerEntry.objects.create(
+                user_id=request_obj.employee_id, category_id=request_obj.category_id,
+                kind='refund', hours=-extra, request=request_obj,
+            )
+        return True
+
+    @classmethod
+    def refund_requests(cls, request_ids):
+        """
+        refund_request() for many requests at once: one aggregate query over
+        the ledger and one UPDATE per (user, category) pair. Returns the
+        total refunded hours.
+        """
+        debited = LeaveLedgerEntry.objects.filter(request_id__in=request_ids).values(
+            'request_id', 'user_id', 'category_id'
+        ).annotate(net=Sum('hours')).filter(net__lt=0)
+        refunds = {}
+        entries = []
+        for row in debited:
+            key = (row['user_id'], row['category_id'])
+            refunds[key] = refunds.get(key, 0) - row['net']
+            entries.append(LeaveLedgerEntry(
+                user_id=row['user_id'], category_id=row['category_id'],
+                kind='refund', hours=-row['net'], request_id=row['request_id'],
+            ))
+        with transaction.atomic():
+            for (user_id, category_id), hours in refunds.items():
+                cls.objects.filter(user_id=user_id, category_id=category_id).update(
+                    remaining_hours=F('remaining_hours') + hours
+                )
+            LeaveLedgerEntry.objects.bulk_create(entries)
+        return sum(refunds.values())
+
     def __str__(self):
         return f"{self.user.username} - {self.category.name}: {self.remaining_hours}/{self.allocated_hours}"
 
+
+# ---------------------------
+# LeaveLedgerEntry Model
+# Append-only history of every change to a (user, category) balance:
+# grants and refunds are positive hours, debits and expiries negative.
+# UserLeaveBalance.remaining_hours is the running total of these entries;
+# reconcile_ledger recomputes it and writes LeaveBalanceSnapshot rows.
+# ---------------------------
+class LeaveLedgerEntry(models.Model):
+    KIND_CHOICES = [
+        ('grant', 'Grant'),
+        ('debit', 'Debit'),
+        ('refund', 'Refund'),
+        ('expiry', 'Expiry'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='ledger_entries')
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='ledger_entries')
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    hours = models.FloatField()  # Signed: positive adds to the balance, negative takes from it.
+    request = models.ForeignKey('Request', on_delete=models.SET_NULL, null=True, blank=True, related_name='ledger_entries')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'category', 'id'], name='ledger_user_category_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError("Ledger entries are append-only; record a correcting entry instead.")
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"{self.user_id} {self.category_id} {self.kind} {self.hours:+g}h"
+
+
+# ---------------------------
+# LeaveBalanceSnapshot Model
+# Balance of a (user, category) pair including every ledger entry up to
+# and including last_entry_id. reconcile_ledger starts each pair from its
+# latest snapshot and only reads the entries after it; --snapshot writes
+# new ones and drops those they replace.
+# ---------------------------
+class LeaveBalanceSnapshot(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='balance_snapshots')
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='balance_snapshots')
+    last_entry_id = models.BigIntegerField()
+    balance = models.FloatField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'category', 'last_entry_id'], name='snapshot_user_category_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} {self.category_id} @{self.last_entry_id}: {self.balance}"
+
+# ---------------------------
+# JobCheckpoint Model
+# Progress of a resumable batch job: the id of the last row it committed,
+# so a rerun after a crash picks up after it.
+# ---------------------------
+class JobCheckpoint(models.Model):
+    name = models.CharField(max_length=100, unique=True)
+    position = models.BigIntegerField(default=0)
+    finished = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} @{self.position}{' (finished)' if self.finished else ''}"
+
+# ---------------------------
+# OutboxEmail Model
+# Notification emails are written here in the same transaction as the
+# change they report, and delivered later by the send_outbox command
+# (see leave.outbox), so requests never wait on the mail server.
+# ---------------------------
+class OutboxEmail(models.Model):
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sent', 'Sent'),
+        ('dead', 'Dead'),  # Gave up after too many failed attempts.
+    ]
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=255)
+    recipients = models.JSONField()  # List of addresses.
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.IntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_due_idx'),
+        ]
+
+    @classmethod
+    def build(cls, subject, body, recipients, from_email="no-reply@yourcompany.com"):
+        """Unsaved outbox entry, for bulk_create()."""
+        return cls(subject=subject, body=body, from_email=from_email, recipients=[r for r in recipients if r])
+
+    @classmethod
+    def enqueue(cls, subject, body, recipients, from_email="no-reply@yourcompany.com"):
+        """
+        Queue an email for the send_outbox worker. Call this inside the
+        transaction that makes the change, so the email is only sent if it
+        commits. Entries without any recipient are not queued.
+        """
+        email = cls.build(subject, body, recipients, from_email)
+        if email.recipients:
+            email.save()
+        return email
+
+    def __str__(self):
+        return f"{self.subject} -> {', '.join(self.recipients)} ({self.status})"
+
+
 # ---------------------------
 # Request Model
 # Represents a vacation time request.
 # ---------------------------
 
+RequestState = namedtuple('RequestState', ['employee_id', 'category_id', 'status', 'start_date', 'end_date', 'hours_per_day'])
+
+
 class Request(models.Model):
+    # Statuses that count as leave being taken (or about to be).
+    ACTIVE_STATUSES = ('submitted', 'approved')
+
     STATUS_CHOICES = [
         ('created', 'Created'),
         ('submitted', 'Submitted'),
@@ -117,6 +466,18 @@ class Request(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='created')
     created_at = models.DateTimeField(auto_now_add=True)
     submitted_at = models.DateTimeField(blank=True, null=True)
+    # Bumped on every save; bulk update() calls must set it themselves.
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Overlap check in clean(): employee + date range.
+            models.Index(fields=['employee', 'start_date', 'end_date'], name='request_employee_dates_idx'),
+            # Dashboard: own requests by status, and subordinates' submitted requests.
+            models.Index(fields=['employee', 'status'], name='request_employee_status_idx'),
+            # Keyset pagination of the request listings (HR search over everyone).
+            models.Index(fields=['start_date', 'id'], name='request_start_id_idx'),
+        ]
     
     def clean(self):
         # First, allow any built-in validations to run
@@ -141,32 +502,128 @@ class Request(models.Model):
             raise ValidationError("There is an existing leave request that overlaps with these dates. Please delete or modify the existing request first.")
 
         # Now, validate all applicable restrictions.
+        # The compiled ruleset is cached per (category, location), so this
+        # normally costs no queries until a restriction is changed.
         errors = []
-        # Define the list of concrete restriction classes.
-        restriction_classes = [
-            DateExclusionRestriction,
-            AdjacentDayRestriction,
-            ConsecutiveDayRestriction,
-            CoworkerRestriction,
-            DayOfWeekRestriction,
-            PeriodLimitRestriction,
-        ]
-        # For each restriction class, get restrictions that apply.
-        # Here we use a simple filter based on category.
-        for RestrictionClass in restriction_classes:
-            applicable_restrictions = RestrictionClass.objects.filter(category=self.category)
-            for restr in applicable_restrictions:
-                result = restr.validate(self)
-                if not result.validated():
-                    errors.extend(result.get_errors())
+        context = ValidationContext()
+        ruleset = get_restriction_ruleset(self.category_id, self.employee.location_id)
+        for restr in ruleset:
+            result = metrics.timed_validate(restr, self, context)
+            if not result.validated():
+                errors.extend(result.get_errors())
         if errors:
             # Raise a non-field error with all the collected messages.
             raise ValidationError({'__all__': errors})
+
+    @classmethod
+    def validate_many(cls, requests, restrictions=True):
+        """
+        Validate many unsaved (or edited) requests in one pass, applying the
+        same date, overlap and restriction checks as clean(). Existing
+        intervals, rulesets and staffing/ledger data are fetched once for the
+        whole batch. Requests in the batch are also checked for overlaps
+        with each other, but are otherwise validated independently.
+        With restrictions=False only the date and overlap checks run (e.g.,
+        for importing historical records).
+
+        Returns a list with one list of error messages per request, in order.
+        """
+        requests = list(requests)
+        results = [[] for _ in requests]
+        candidates = []
+        for index, request_obj in enumerate(requests):
+            if not request_obj.start_date or not request_obj.end_date:
+                results[index].append("Start date and end date are required.")
+            elif request_obj.end_date < request_obj.start_date:
+                results[index].append("End date cannot be before start date.")
+            else:
+                candidates.append(index)
+        if not candidates:
+            return results
+
+        context = ValidationContext.for_requests([requests[index] for index in candidates], restrictions)
+
+        # Overlaps with stored requests: per employee, the stored intervals
+        # sorted by start with a running maximum of their end dates.
+        stored_intervals = {}
+        for employee_id, start_date, end_date in context.existing_intervals:
+            stored_intervals.setdefault(employee_id, []).append((start_date, end_date))
+        overlap_index = {}
+        for employee_id, intervals in stored_intervals.items():
+            intervals.sort()
+            starts, max_ends, max_end = [], [], None
+            for start_date, end_date in intervals:
+                max_end = end_date if max_end is None else max(max_end, end_date)
+                starts.append(start_date)
+                max_ends.append(max_end)
+            overlap_index[employee_id] = (starts, max_ends)
+
+        # Overlaps within the batch: sweep each employee's candidates by start date.
+        by_employee = {}
+        for index in candidates:
+            by_employee.setdefault(requests[index].employee_id, []).append(index)
+        for indexes in by_employee.values():
+            indexes.sort(key=lambda index: (requests[index].start_date, index))
+            max_end = None
+            for index in indexes:
+                request_obj = requests[index]
+                if max_end is not None and request_obj.start_date <= max_end:
+                    results[index].append("This request overlaps with another request in the same batch.")
+                max_end = request_obj.end_date if max_end is None else max(max_end, request_obj.end_date)
+
+        rulesets = get_restriction_rulesets(
+            (requests[index].category_id, context.location_of(requests[index])) for index in candidates
+        ) if restrictions else {}
+        for index in candidates:
+            request_obj = requests[index]
+            errors = results[index]
+            starts, max_ends = overlap_index.get(request_obj.employee_id, ((), ()))
+            position = bisect.bisect_right(starts, request_obj.end_date)
+            if position and max_ends[position - 1] >= request_obj.start_date:
+                errors.append("There is an existing leave request that overlaps with these dates. Please delete or modify the existing request first.")
+            if errors or not restrictions:
+                # As in clean(), an overlapping request is not checked any further.
+                continue
+
+            for restr in rulesets[(request_obj.category_id, context.location_of(request_obj))]:
+                result = metrics.timed_validate(restr, request_obj, context)
+                if not result.validated():
+                    errors.extend(result.get_errors())
+        return results
         
     def save(self, *args, **kwargs):
         # Enforce validation before saving
         self.full_clean()
-        super().save(*args, **kwargs)
+        # Derived tables are updated from post_save, inside the same transaction.
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the loaded state so signal handlers can diff it on save.
+        instance._loaded_state = instance.tracked_state()
+        return instance
+
+    def stored_state(self):
+        """Return the RequestState currently stored in the database, or None for new requests."""
+        if not self.pk:
+            return None
+        state = getattr(self, '_loaded_state', None)
+        if state is None:
+            row = Request.objects.filter(pk=self.pk).values_list(*RequestState._fields).first()
+            state = RequestState(*row) if row else None
+        return state
+
+    def tracked_state(self):
+        """
+        Return the fields derived tables depend on as a RequestState,
+        or None if any of them is deferred.
+        """
+        values = [self.__dict__.get(field, DEFERRED) for field in RequestState._fields]
+        if DEFERRED in values:
+            return None
+        return RequestState(*values)
         
     def __str__(self):
         username = self.employee.username if self.employee else "Unassigned"
@@ -189,6 +646,245 @@ class ValidationResult:
     def get_errors(self):
         return self.errors
 
+# ---------------------------
+# ValidationContext Helper Class
+# Not a model; supplies the data restrictions look up beyond the request
+# itself. A plain instance queries on demand (one request at a time, as in
+# Request.clean()); ValidationContext.for_requests() prefetches everything
+# a batch needs in a fixed number of queries (Request.validate_many()).
+# ---------------------------
+class ValidationContext:
+    def __init__(self):
+        self.prefetched = False
+        self.existing_intervals = []
+        self._locations = {}
+        self._stored_states = {}
+        self._headcounts = {}
+        self._staffing = {}
+        self._period_hours = {}
+
+    @classmethod
+    def for_requests(cls, requests, restrictions=True):
+        """
+        Prefetch everything validate_many() needs for a batch. Without
+        restrictions only the locations and overlapping requests are loaded.
+        """
+        context = cls()
+        context.prefetched = True
+        employee_ids = {r.employee_id for r in requests}
+        window_start = min(r.start_date for r in requests)
+        window_end = max(r.end_date for r in requests)
+        stored_pks = [r.pk for r in requests if r.pk]
+
+        context._locations = dict(User.objects.filter(pk__in=employee_ids).values_list('id', 'location_id'))
+        location_ids = {location_id for location_id in context._locations.values() if location_id is not None}
+
+        existing = Request.objects.filter(
+            employee_id__in=employee_ids, start_date__lte=window_end, end_date__gte=window_start
+        )
+        if stored_pks:
+            existing = existing.exclude(pk__in=stored_pks)
+            for row in Request.objects.filter(pk__in=stored_pks).values_list('pk', *RequestState._fields):
+                context._stored_states[row[0]] = RequestState(*row[1:])
+        context.existing_intervals = list(existing.values_list('employee_id', 'start_date', 'end_date'))
+        if not restrictions:
+            return context
+
+        context._headcounts = dict(Location.objects.filter(pk__in=location_ids).values_list('id', 'headcount'))
+        staffing_rows = LocationDayStaffing.objects.filter(
+            location_id__in=location_ids, date__gte=window_start, date__lte=window_end
+        ).values_list('location_id', 'date', 'on_leave_count')
+        for location_id, date, count in staffing_rows:
+            context._staffing.setdefault(location_id, {})[date] = count
+
+        period_rows = EmployeePeriodHours.objects.filter(
+            employee_id__in=employee_ids,
+            period_start__gte=min(period_start_for(window_start, period) for period in EmployeePeriodHours.PERIODS),
+            period_start__lte=window_end,
+        ).values_list('employee_id', 'category_id', 'period', 'period_start', 'hours')
+        for employee_id, category_id, period, period_start, hours in period_rows:
+            context._period_hours[(employee_id, category_id, period, period_start)] = hours
+        return context
+
+    def location_of(self, request_obj):
+        if self.prefetched:
+            return self._locations.get(request_obj.employee_id)
+        return request_obj.employee.location_id
+
+    def stored_state(self, request_obj):
+        if self.prefetched or not request_obj.pk:
+            return self._stored_states.get(request_obj.pk)
+        return request_obj.stored_state()
+
+    def headcount(self, location_id):
+        if location_id not in self._headcounts:
+            self._headcounts[location_id] = Location.objects.filter(pk=location_id).values_list('headcount', flat=True).get()
+        return self._headcounts[location_id]
+
+    def on_leave_counts(self, location_id, start_date, end_date):
+        """Return the on-leave count of every day from start_date to end_date."""
+        if self.prefetched:
+            staffing = self._staffing.get(location_id, {})
+        else:
+            staffing = dict(LocationDayStaffing.objects.filter(
+                location_id=location_id, date__gte=start_date, date__lte=end_date
+            ).values_list('date', 'on_leave_count'))
+        num_days = (end_date - start_date).days + 1
+        return [staffing.get(start_date + datetime.timedelta(days=offset), 0) for offset in range(num_days)]
+
+    def booked_period_hours(self, employee_id, category_id, period, period_starts):
+        """Return {period_start: hours} already booked for the given periods."""
+        if self.prefetched:
+            return {
+                period_start: self._period_hours[(employee_id, category_id, period, period_start)]
+                for period_start in period_starts
+                if (employee_id, category_id, period, period_start) in self._period_hours
+            }
+        return dict(EmployeePeriodHours.objects.filter(
+            employee_id=employee_id,
+            category_id=category_id,
+            period=period,
+            period_start__in=list(period_starts),
+        ).values_list('period_start', 'hours'))
+
+# ---------------------------
+# LocationDayStaffing Model
+# Materialized number of employees on active leave ('submitted' or
+# 'approved') per location and day. Maintained incrementally by
+# leave.signals through leave.aggregates; rebuild it with the
+# rebuild_staffing command and verify it with check_staffing.
+# ---------------------------
+class LocationDayStaffing(models.Model):
+    location = models.ForeignKey(Location, on_delete=models.CASCADE, related_name='daily_staffing')
+    date = models.DateField()
+    on_leave_count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('location', 'date')
+
+    def __str__(self):
+        return f"{self.location_id} {self.date}: {self.on_leave_count} on leave"
+
+# ---------------------------
+# EmployeePeriodHours Model
+# Ledger of active leave hours ('submitted' or 'approved') per employee,
+# category and period (ISO week starting Monday, or calendar month).
+# Maintained in the same transaction as request changes by
+# leave.signals through leave.aggregates; PeriodLimitRestriction reads it.
+# ---------------------------
+class EmployeePeriodHours(models.Model):
+    PERIODS = ('week', 'month')
+    PERIOD_CHOICES = [
+        ('week', 'ISO Week'),
+        ('month', 'Calendar Month'),
+    ]
+
+    employee = models.ForeignKey(User, on_delete=models.CASCADE, related_name='period_hours')
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='period_hours')
+    period = models.CharField(max_length=10, choices=PERIOD_CHOICES)
+    period_start = models.DateField()  # Monday of the week, or first day of the month.
+    hours = models.FloatField(default=0)
+
+    class Meta:
+        unique_together = ('employee', 'category', 'period', 'period_start')
+
+    def __str__(self):
+        return f"{self.employee_id} {self.category_id} {self.period} {self.period_start}: {self.hours}h"
+
+
+def period_start_for(date, period):
+    if period == 'week':
+        return date - datetime.timedelta(days=date.weekday())
+    return date.replace(day=1)
+
+
+def next_period_start(period_start, period):
+    if period == 'week':
+        return period_start + datetime.timedelta(days=7)
+    if period_start.month == 12:
+        return period_start.replace(year=period_start.year + 1, month=1)
+    return period_start.replace(month=period_start.month + 1)
+
+
+def split_hours_by_period(start_date, end_date, hours_per_day, period):
+    """
+    Split the hours of a leave span into {period_start: hours} for every
+    week or month it touches. Works per period, not per day.
+    """
+    hours = {}
+    period_start = period_start_for(start_date, period)
+    while period_start <= end_date:
+        following = next_period_start(period_start, period)
+        first_day = max(start_date, period_start)
+        last_day = min(end_date, following - datetime.timedelta(days=1))
+        hours[period_start] = ((last_day - first_day).days + 1) * hours_per_day
+        period_start = following
+    return hours
+
+# ---------------------------
+# UtilizationRollup Model
+# Leave hours per category, location and calendar month, split into
+# 'approved' (taken) and 'submitted' (pending) hours. Maintained by
+# leave.signals through leave.aggregates; rebuild it with the
+# rebuild_utilization command. Like LocationDayStaffing, it leaves out
+# employees without a location.
+# ---------------------------
+class UtilizationRollup(models.Model):
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='utilization')
+    location = models.ForeignKey(Location, on_delete=models.CASCADE, related_name='utilization')
+    month = models.DateField()  # First day of the month.
+    taken_hours = models.FloatField(default=0)
+    pending_hours = models.FloatField(default=0)
+
+    class Meta:
+        unique_together = ('category', 'location', 'month')
+        indexes = [
+            models.Index(fields=['month'], name='utilization_month_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.category_id} {self.location_id} {self.month:%Y-%m}: {self.taken_hours}h taken, {self.pending_hours}h pending"
+
+# ---------------------------
+# Per-day leave counting
+# ---------------------------
+def count_on_leave_by_day(intervals, window_start, window_end):
+    """
+    Sweep (employee_id, start_date, end_date) intervals into a list holding,
+    for each day from window_start to window_end, the number of distinct
+    employees on leave that day. Overlapping intervals of one employee are
+    merged first so nobody is counted twice.
+    """
+    by_employee = {}
+    for employee_id, start_date, end_date in intervals:
+        start_date = max(start_date, window_start)
+        end_date = min(end_date, window_end)
+        if start_date <= end_date:
+            by_employee.setdefault(employee_id, []).append((start_date, end_date))
+
+    num_days = (window_end - window_start).days + 1
+    # Difference array: +1 on the first day of a merged interval, -1 after its last day.
+    deltas = [0] * (num_days + 1)
+    for spans in by_employee.values():
+        spans.sort()
+        merged_start, merged_end = spans[0]
+        for start_date, end_date in spans[1:]:
+            if start_date <= merged_end + datetime.timedelta(days=1):
+                merged_end = max(merged_end, end_date)
+                continue
+            deltas[(merged_start - window_start).days] += 1
+            deltas[(merged_end - window_start).days + 1] -= 1
+            merged_start, merged_end = start_date, end_date
+        deltas[(merged_start - window_start).days] += 1
+        deltas[(merged_end - window_start).days + 1] -= 1
+
+    counts = []
+    running = 0
+    for delta in deltas[:num_days]:
+        running += delta
+        counts.append(running)
+    return counts
+
 # ---------------------------
 # RestrictionParameterDescriptor Helper Class
 # Encapsulates metadata about required parameters for a restriction.
@@ -224,11 +920,29 @@ class Restriction(models.Model):
     def set_parameter(self, key, value):
         self.parameters[key] = value
         self.save()
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # Parameters may have changed; recompile on next use.
+        self.__dict__.pop('compiled', None)
+
+    def compile(self):
+        """
+        Hook for subclasses: turn the raw JSON parameters into whatever
+        validate() needs, so the work is done once per loaded restriction
+        instead of once per validated request. The default compiles nothing.
+        """
+        return None
+
+    @cached_property
+    def compiled(self):
+        return self.compile()
     
-    def validate(self, request_obj):
+    def validate(self, request_obj, context=None):
         """
         Abstract method; concrete subclasses must implement this.
-        Should return a ValidationResult object.
+        Should return a ValidationResult object. Restrictions that need
+        data beyond the request read it through the ValidationContext.
         """
         raise NotImplementedError("Subclasses must implement validate()")
 
@@ -236,25 +950,35 @@ class Restriction(models.Model):
 # Concrete Restriction Subclasses
 # ---------------------------
 
+def parse_iso_dates(values):
+    """Parse a list of ISO date strings; raises ValueError/TypeError on bad input."""
+    return [datetime.datetime.strptime(d, "%Y-%m-%d").date() for d in values]
+
+
 class DateExclusionRestriction(Restriction):
     """
     Prevents requests on specified dates.
     Expects a parameter "excluded_dates": a list of ISO date strings.
+    The dates are compiled once into a sorted tuple and matched with bisect.
     """
-    def validate(self, request_obj):
-        result = ValidationResult()
-        excluded_dates = self.get_parameter("excluded_dates") or []
+    def compile(self):
         try:
-            excluded_dates = [datetime.datetime.strptime(d, "%Y-%m-%d").date() for d in excluded_dates]
+            return tuple(sorted(set(parse_iso_dates(self.get_parameter("excluded_dates") or []))))
         except Exception:
+            return None
+
+    def validate(self, request_obj, context=None):
+        result = ValidationResult()
+        excluded_dates = self.compiled
+        if excluded_dates is None:
             result.add_error("Invalid date format in excluded_dates parameter.")
             return result
-        
-        current_date = request_obj.start_date
-        while current_date <= request_obj.end_date:
-            if current_date in excluded_dates:
-                result.add_error(f"Date {current_date} is excluded.")
-            current_date += datetime.timedelta(days=1)
+
+        # Only the excluded dates inside the requested span are visited.
+        first = bisect.bisect_left(excluded_dates, request_obj.start_date)
+        last = bisect.bisect_right(excluded_dates, request_obj.end_date)
+        for excluded_date in excluded_dates[first:last]:
+            result.add_error(f"Date {excluded_date} is excluded.")
         
         return result
 
@@ -262,18 +986,26 @@ class AdjacentDayRestriction(Restriction):
     """
     Ensures vacation time is not taken directly adjacent to specified holidays.
     Expects a parameter "holidays": a list of ISO date strings.
+    The holidays are compiled once into a frozenset.
     """
-    def validate(self, request_obj):
-        result = ValidationResult()
-        holidays = self.get_parameter("holidays") or []
+    def compile(self):
         try:
-            holidays = [datetime.datetime.strptime(d, "%Y-%m-%d").date() for d in holidays]
+            return frozenset(parse_iso_dates(self.get_parameter("holidays") or []))
         except Exception:
+            return None
+
+    def validate(self, request_obj, context=None):
+        result = ValidationResult()
+        holidays = self.compiled
+        if holidays is None:
             result.add_error("Invalid date format in holidays parameter.")
             return result
         
-        for holiday in holidays:
-            if request_obj.start_date == holiday - datetime.timedelta(days=1) or request_obj.end_date == holiday + datetime.timedelta(days=1):
+        # A request is adjacent to a holiday that falls the day after it starts
+        # or the day before it ends, so only those two dates need checking.
+        one_day = datetime.timedelta(days=1)
+        for holiday in sorted({request_obj.start_date + one_day, request_obj.end_date - one_day}):
+            if holiday in holidays:
                 result.add_error(f"Request is adjacent to holiday on {holiday}.")
         return result
 
@@ -282,7 +1014,7 @@ class ConsecutiveDayRestriction(Restriction):
     Limits the number of consecutive days off.
     Expects a parameter "max_consecutive_days": an integer.
     """
-    def validate(self, request_obj):
+    def validate(self, request_obj, context=None):
         result = ValidationResult()
         max_days = self.get_parameter("max_consecutive_days")
         if max_days is None:
@@ -299,7 +1031,7 @@ class CoworkerRestriction(Restriction):
     Expects parameters:
       - "min_count": integer representing the minimum required number of coworkers.
     """
-    def validate(self, request_obj):
+    def validate(self, request_obj, context=None):
         result = ValidationResult()
         min_count = self.get_parameter("min_count")
         if min_count is None:
@@ -311,24 +1043,20 @@ class CoworkerRestriction(Restriction):
             result.add_error("Parameter 'min_count' must be an integer.")
             return result
 
-        # Helper function: For a given date, compute number of scheduled coworkers.
-        def get_scheduled_coworker_count(employee, date):
-            # Get all employees at the same location except the current employee.
-            total_at_location = employee.location.employees.exclude(id=employee.id).count()
-            # Find out how many are on leave on that specific date.
-            # Consider Requests in statuses that represent active leave (e.g., 'submitted' and 'approved').
-            on_leave = Request.objects.filter(
-                employee__location=employee.location,
-                start_date__lte=date,
-                end_date__gte=date,
-                status__in=['submitted', 'approved']
-            ).values_list('employee', flat=True).distinct().count()
-            # Scheduled coworkers are those who are at the location but not on leave.
-            return total_at_location - on_leave
+        context = context or ValidationContext()
+        location_id = context.location_of(request_obj)
+        if location_id is None:
+            # Employees without a location have no coworkers to keep scheduled.
+            return result
+        # Everyone at the location except the requesting employee.
+        total_at_location = context.headcount(location_id) - 1
+        # Per-day on-leave counts come from the LocationDayStaffing table.
+        on_leave_counts = context.on_leave_counts(location_id, request_obj.start_date, request_obj.end_date)
 
         current_date = request_obj.start_date
-        while current_date <= request_obj.end_date:
-            scheduled_count = get_scheduled_coworker_count(request_obj.employee, current_date)
+        for on_leave in on_leave_counts:
+            # Scheduled coworkers are those who are at the location but not on leave.
+            scheduled_count = total_at_location - on_leave
             if scheduled_count < min_count:
                 result.add_error(
                     f"On {current_date}, only {scheduled_count} coworkers are scheduled, which is less than the required minimum of {min_count}."
@@ -336,23 +1064,70 @@ class CoworkerRestriction(Restriction):
             current_date += datetime.timedelta(days=1)
         return result
 
+WEEKDAY_NAMES = ('Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday')
+ALL_WEEKDAYS_MASK = 0b1111111
+
+
+def weekday_mask(start_date, end_date):
+    """Bitmask (bit 0 = Monday) of the weekdays covered by a date span, computed without iterating."""
+    num_days = (end_date - start_date).days + 1
+    if num_days >= 7:
+        return ALL_WEEKDAYS_MASK
+    if num_days <= 0:
+        return 0
+    # num_days consecutive bits starting at the start weekday, wrapped around the week.
+    run = ((1 << num_days) - 1) << start_date.weekday()
+    return (run | (run >> 7)) & ALL_WEEKDAYS_MASK
+
+
 class DayOfWeekRestriction(Restriction):
     """
     Restricts requests to specified days of the week.
     Expects a parameter "allowed_days": a list of weekday numbers (0=Monday, 6=Sunday).
+    The allowed days are compiled into a 7-bit mask, so the check does not
+    depend on the length of the request.
     """
-    def validate(self, request_obj):
-        result = ValidationResult()
+    def compile(self):
         allowed_days = self.get_parameter("allowed_days")
         if allowed_days is None:
+            return None
+        try:
+            mask = 0
+            for day in allowed_days:
+                if not 0 <= int(day) <= 6:
+                    raise ValueError(day)
+                mask |= 1 << int(day)
+        except (TypeError, ValueError):
+            return -1
+        return mask
+
+    def validate(self, request_obj, context=None):
+        result = ValidationResult()
+        allowed_mask = self.compiled
+        if allowed_mask is None:
             result.add_error("Parameter 'allowed_days' not set.")
             return result
-        
-        current_date = request_obj.start_date
-        while current_date <= request_obj.end_date:
-            if current_date.weekday() not in allowed_days:
-                result.add_error(f"Day {current_date} (weekday {current_date.weekday()}) is not allowed for leave.")
-            current_date += datetime.timedelta(days=1)
+        if allowed_mask < 0:
+            result.add_error("Parameter 'allowed_days' must be a list of weekday numbers (0-6).")
+            return result
+
+        disallowed = weekday_mask(request_obj.start_date, request_obj.end_date) & ~allowed_mask
+        if disallowed:
+            # One summary line instead of one per day: the disallowed weekdays
+            # and how many days of the request fall on them.
+            num_days = (request_obj.end_date - request_obj.start_date).days + 1
+            full_weeks, remainder = divmod(num_days, 7)
+            start_weekday = request_obj.start_date.weekday()
+            weekdays = [weekday for weekday in range(7) if disallowed & (1 << weekday)]
+            day_count = sum(
+                full_weeks + (1 if (weekday - start_weekday) % 7 < remainder else 0)
+                for weekday in weekdays
+            )
+            names = ", ".join(WEEKDAY_NAMES[weekday] for weekday in weekdays)
+            result.add_error(
+                f"Request includes {day_count} day(s) on weekdays not allowed for leave ({names}) "
+                f"between {request_obj.start_date} and {request_obj.end_date}."
+            )
         return result
 
 class PeriodLimitRestriction(Restriction):
@@ -361,18 +1136,129 @@ class PeriodLimitRestriction(Restriction):
     Expects parameters:
       - "max_hours": maximum allowed hours.
       - "period": string indicating the period ('week' or 'month').
+    Hours the employee already has in the same category and period are read
+    from the EmployeePeriodHours ledger and added to the requested hours.
     """
-    def validate(self, request_obj):
+    def validate(self, request_obj, context=None):
         result = ValidationResult()
         max_hours = self.get_parameter("max_hours")
         period = self.get_parameter("period")
         if max_hours is None or period is None:
             result.add_error("Parameters 'max_hours' and/or 'period' not set.")
             return result
-        
-        # For demonstration, calculate total hours for the request.
-        total_days = (request_obj.end_date - request_obj.start_date).days + 1
-        total_hours = request_obj.hours_per_day * total_days
-        if total_hours > max_hours:
-            result.add_error(f"Total requested hours ({total_hours}) exceed the limit of {max_hours} for the {period}.")
-        return result
\ No newline at end of file
+        if period not in EmployeePeriodHours.PERIODS:
+            result.add_error("Parameter 'period' must be 'week' or 'month'.")
+            return result
+
+        context = context or ValidationContext()
+        requested = split_hours_by_period(request_obj.start_date, request_obj.end_date, request_obj.hours_per_day, period)
+        booked = context.booked_period_hours(request_obj.employee_id, request_obj.category_id, period, requested)
+
+        # When editing, the ledger already holds this request's stored hours.
+        stored = context.stored_state(request_obj)
+        if stored and stored.status in Request.ACTIVE_STATUSES and (stored.employee_id, stored.category_id) == (request_obj.employee_id, request_obj.category_id):
+            for period_start, hours in split_hours_by_period(stored.start_date, stored.end_date, stored.hours_per_day, period).items():
+                booked[period_start] = booked.get(period_start, 0) - hours
+
+        for period_start, hours in requested.items():
+            total_hours = booked.get(period_start, 0) + hours
+            if total_hours > max_hours:
+                result.add_error(
+                    f"Total hours ({total_hours:g}) in the {period} starting {period_start} exceed the limit of {max_hours}."
+                )
+        return result
+
+
+# ---------------------------
+# Compiled Restriction Ruleset
+# Request.clean() needs every restriction that applies to the request's
+# category and the employee's location. Loading them costs one query per
+# concrete class, so the compiled result is kept in a process-local cache
+# keyed by (category_id, location_id). Like the Grant cache, it is checked
+# against a version token in Django's cache, which leave.signals bumps
+# whenever a restriction row or its category/location links change, so
+# every process drops its rulesets, not just the one that saved.
+# ---------------------------
+RESTRICTION_CLASSES = [
+    DateExclusionRestriction,
+    AdjacentDayRestriction,
+    ConsecutiveDayRestriction,
+    CoworkerRestriction,
+    DayOfWeekRestriction,
+    PeriodLimitRestriction,
+]
+
+RULESET_CACHE_VERSION_KEY = 'leave:ruleset-cache-version'
+
+_ruleset_cache = {'version': None, 'rulesets': {}}
+
+
+def _current_rulesets():
+    """Return this process's {(category_id, location_id): ruleset} dict, emptied first if stale."""
+    if _awaiting_commit(clear_restriction_ruleset_cache):
+        # Restrictions changed in the open transaction: load them into a
+        # throwaway dict, so a rollback cannot leave them cached.
+        return {}
+    version = _shared_cache_version(RULESET_CACHE_VERSION_KEY)
+    if version is None or version != _ruleset_cache['version']:
+        _ruleset_cache.update(version=version, rulesets={})
+    return _ruleset_cache['rulesets']
+
+
+def get_restriction_ruleset(category_id, location_id):
+    """
+    Return a tuple of compiled restrictions applying to the given category
+    and location. A restriction applies when it is linked to the category
+    and is either linked to no location at all or to the given one.
+    """
+    key = (category_id, location_id)
+    cached = _current_rulesets()
+    ruleset = cached.get(key)
+    if ruleset is None:
+        ruleset = []
+        if category_id is not None:
+            location_filter = Q(location__isnull=True)
+            if location_id is not None:
+                location_filter |= Q(location=location_id)
+            for RestrictionClass in RESTRICTION_CLASSES:
+                restrictions = RestrictionClass.objects.filter(category=category_id).filter(location_filter).distinct()
+                for restr in restrictions:
+                    restr.compiled  # Compile up front so cached entries are ready to run.
+                    ruleset.append(restr)
+        ruleset = tuple(ruleset)
+        cached[key] = ruleset
+    return ruleset
+
+
+def get_restriction_rulesets(keys):
+    """
+    Return {(category_id, location_id): ruleset} for many keys at once.
+    Missing rulesets are loaded together with a fixed number of queries
+    per restriction class, however many keys there are.
+    """
+    keys = set(keys)
+    cached = _current_rulesets()
+    missing = {key for key in keys if key not in cached}
+    if len(missing) > 1:
+        rulesets = {key: [] for key in missing}
+        category_ids = {category_id for category_id, _ in missing if category_id is not None}
+        for RestrictionClass in RESTRICTION_CLASSES:
+            restrictions = RestrictionClass.objects.filter(
+                category__in=category_ids
+            ).distinct().prefetch_related('category', 'location')
+            for restr in restrictions:
+                restr.compiled  # Compile up front so cached entries are ready to run.
+                restr_categories = {category.pk for category in restr.category.all()}
+                restr_locations = {location.pk for location in restr.location.all()}
+                for category_id, location_id in missing:
+                    if category_id in restr_categories and (not restr_locations or location_id in restr_locations):
+                        rulesets[(category_id, location_id)].append(restr)
+        for key, ruleset in rulesets.items():
+            cached[key] = tuple(ruleset)
+    return {key: cached[key] if key in cached else get_restriction_ruleset(*key) for key in keys}
+
+
+def clear_restriction_ruleset_cache():
+    """Drop this process's rulesets and tell every other process to drop theirs."""
+    _ruleset_cache.update(version=None, rulesets={})
+    cache.set(RULESET_CACHE_VERSION_KEY, uuid.uuid4().hex, None)
@@ -0,0 +1,111 @@
+"""
+Delivery of queued OutboxEmail rows, driven by the send_outbox command.
+
+Each batch is claimed by pushing its next_attempt_at forward by a lease
+(inside a transaction that locks the rows where the database supports
+it), so several workers can run without sending the same email twice,
+and an email claimed by a worker that crashed is retried once the lease
+runs out. The batch is then sent over one reused mail connection.
+
+A failed email is retried with exponential backoff; after max_attempts
+failures it is marked dead and left for someone to look at in the admin.
+"""
+import datetime
+import logging
+
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from .models import OutboxEmail
+
+logger = logging.getLogger('leave.outbox')
+
+LEASE_SECONDS = 300
+RETRY_BASE_SECONDS = 60
+RETRY_MAX_SECONDS = 3600
+DEFAULT_MAX_ATTEMPTS = 5
+
+
+def retry_delay(attempts):
+    """Seconds to wait before the next attempt after the given number of failures."""
+    return min(RETRY_BASE_SECONDS * 2 ** (attempts - 1), RETRY_MAX_SECONDS)
+
+
+def _claim_batch(batch_size):
+    now = timezone.now()
+    with transaction.atomic():
+        batch = list(OutboxEmail.objects.select_for_update(skip_locked=True).filter(
+            status='pending', next_attempt_at__lte=now
+        ).order_by('next_attempt_at', 'id')[:batch_size])
+        OutboxEmail.objects.filter(pk__in=[email.pk for email in batch]).update(
+            next_attempt_at=now + datetime.timedelta(seconds=LEASE_SECONDS)
+        )
+    return batch
+
+
+def _record_failure(email, error, max_attempts):
+    email.attempts += 1
+    email.last_error = str(error) or error.__class__.__name__
+    if email.attempts >= max_attempts:
+        email.status = 'dead'
+        logger.error("Giving up on outbox email id=%s after %d attempts: %s", email.pk, email.attempts, email.last_error)
+    else:
+        email.next_attempt_at = timezone.now() + datetime.timedelta(seconds=retry_delay(email.attempts))
+    email.save(update_fields=['attempts', 'last_error', 'status', 'next_attempt_at'])
+
+
+def send_batch(batch_size=100, max_attempts=DEFAULT_MAX_ATTEMPTS):
+    """
+    Claim and send up to batch_size due emails. Returns (sent, failed),
+    or None if nothing was due.
+    """
+    batch = _claim_batch(batch_size)
+    if not batch:
+        return None
+    connection = get_connection()
+    try:
+        connection.open()
+    except Exception as error:
+        # The mail server is unreachable: every email in the batch waits for a retry.
+        for email in batch:
+            _record_failure(email, error, max_attempts)
+        return 0, len(batch)
+
+    sent_ids = []
+    failed = 0
+    try:
+        for email in batch:
+            message = EmailMessage(
+                subject=email.subject, body=email.body, from_email=email.from_email,
+                to=email.recipients, connection=connection,
+            )
+            try:
+                # One message per call, so a bad recipient only fails its own email.
+                connection.send_messages([message])
+            except Exception as error:
+                _record_failure(email, error, max_attempts)
+                failed += 1
+            else:
+                sent_ids.append(email.pk)
+    finally:
+        connection.close()
+        OutboxEmail.objects.filter(pk__in=sent_ids).update(status='sent', sent_at=timezone.now(), last_error='')
+    return len(sent_ids), failed
+
+
+def drain(batch_size=100, max_attempts=DEFAULT_MAX_ATTEMPTS, stdout=None):
+    """Send batches until no email is due. Returns the total (sent, failed)."""
+    total_sent = total_failed = 0
+    while True:
+        result = send_batch(batch_size, max_attempts)
+        if result is None:
+            return total_sent, total_failed
+        sent, failed = result
+        total_sent += sent
+        total_failed += failed
+        if stdout:
+            stdout.write(f"Sent {sent}, failed {failed}.")
+        if not sent:
+            # Everything in the batch failed; leave the rest for the retry.
+            return total_sent, total_failed
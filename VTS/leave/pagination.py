@@ -0,0 +1,107 @@
+"""
+Keyset ("seek") pagination.
+
+Each page continues after the sort key of the last row of the previous
+page instead of skipping rows with OFFSET. Deep pages therefore cost the
+same as the first one, and rows added meanwhile do not shift later pages.
+The sort key is passed between pages as an opaque cursor string.
+"""
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class Page:
+    def __init__(self, items, next_cursor):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.has_next = next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __bool__(self):
+        return bool(self.items)
+
+
+def encode_cursor(values):
+    payload = json.dumps([None if value is None else str(value) for value in values])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def parse_cursor(cursor, length):
+    """The raw string values of a cursor; raises InvalidCursor unless there are exactly length of them."""
+    try:
+        raw = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (ValueError, TypeError) as error:
+        raise InvalidCursor("Malformed cursor.") from error
+    if not isinstance(raw, list) or len(raw) != length:
+        raise InvalidCursor("Malformed cursor.")
+    return raw
+
+
+def decode_cursor(model, fields, cursor):
+    """Turn a cursor back into typed values for the given sort fields."""
+    raw = parse_cursor(cursor, len(fields))
+    try:
+        return [model._meta.get_field(name).to_python(value) for name, value in zip(fields, raw)]
+    except ValidationError as error:
+        raise InvalidCursor("Malformed cursor.") from error
+
+
+def _after(fields, values, descending):
+    """Q for rows strictly after values in (fields...) order."""
+    lookup = 'lt' if descending else 'gt'
+    condition = Q()
+    for index, name in enumerate(fields):
+        term = Q(**{f'{name}__{lookup}': values[index]})
+        for earlier, value in zip(fields[:index], values[:index]):
+            term &= Q(**{earlier: value})
+        condition |= term
+    return condition
+
+
+def _key_of(item, fields):
+    if isinstance(item, dict):
+        return [item[name] for name in fields]
+    return [getattr(item, name) for name in fields]
+
+
+def paginate(queryset, ordering, cursor=None, page_size=25):
+    """
+    Return one Page of queryset ordered by ordering, e.g. ('start_date',
+    'id') or ('-start_date', '-id'). All keys must sort in the same
+    direction and the last one must be unique. Works with model instances
+    and with values() dicts, as long as the sort fields are selected.
+    Raises InvalidCursor for a cursor this ordering did not produce.
+    """
+    descending = ordering[0].startswith('-')
+    if any(key.startswith('-') != descending for key in ordering):
+        raise ValueError("Keyset pagination needs every key to sort in the same direction.")
+    fields = [key.lstrip('-') for key in ordering]
+    queryset = queryset.order_by(*ordering)
+    if cursor:
+        queryset = queryset.filter(_after(fields, decode_cursor(queryset.model, fields, cursor), descending))
+    # One extra row tells whether there is a next page.
+    items = list(queryset[:page_size + 1])
+    next_cursor = encode_cursor(_key_of(items[page_size - 1], fields)) if len(items) > page_size else None
+    return Page(items[:page_size], next_cursor)
+
+
+def page_url(request, param, cursor):
+    """The current URL with one cursor parameter replaced (or removed when cursor is None)."""
+    query = request.GET.copy()
+    if cursor is None:
+        query.pop(param, None)
+    else:
+        query[param] = cursor
+    return f"?{query.urlencode()}" if query else request.path
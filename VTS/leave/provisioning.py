@@ -0,0 +1,84 @@
+"""
+Bulk provisioning of UserLeaveBalance rows from Grants.
+
+Every (user, category) pair covered by a Grant for the user's role gets a
+balance up front, so the request path never has to create one. The
+provision_balances command runs this for everyone; leave.signals runs it
+for a single grant when it is saved and for a single user when they are
+created or change role.
+"""
+from django.db import transaction
+
+from .models import Grant, LeaveLedgerEntry, User, UserLeaveBalance, get_grants_for_role
+
+
+def _create_balances(pairs):
+    """
+    Insert balances for (user_id, category_id, allocated_hours) tuples,
+    skipping any that already exist, and open their ledgers with a grant.
+    Returns the number of balances inserted.
+    """
+    if not pairs:
+        return 0
+    user_ids = {user_id for user_id, _, _ in pairs}
+    category_ids = {category_id for _, category_id, _ in pairs}
+    with transaction.atomic():
+        existing = set(UserLeaveBalance.objects.filter(
+            user_id__in=user_ids, category_id__in=category_ids,
+        ).values_list('user_id', 'category_id'))
+        missing = [(user_id, category_id, hours) for user_id, category_id, hours in pairs if (user_id, category_id) not in existing]
+        if not missing:
+            return 0
+        UserLeaveBalance.objects.bulk_create(
+            [
+                UserLeaveBalance(user_id=user_id, category_id=category_id, allocated_hours=hours, remaining_hours=hours)
+                for user_id, category_id, hours in missing
+            ],
+            ignore_conflicts=True,
+        )
+        # Only open ledgers that are not open yet, so reruns and races stay idempotent.
+        opened = set(LeaveLedgerEntry.objects.filter(
+            kind='grant', user_id__in=user_ids, category_id__in=category_ids,
+        ).values_list('user_id', 'category_id'))
+        LeaveLedgerEntry.objects.bulk_create([
+            LeaveLedgerEntry(user_id=user_id, category_id=category_id, kind='grant', hours=hours)
+            for user_id, category_id, hours in missing
+            if (user_id, category_id) not in opened
+        ])
+    return len(missing)
+
+
+def provision_grant(grant, chunk_size=1000):
+    """Create missing balances for every user the grant applies to. Returns the number created."""
+    users = User.objects.filter(role=grant.employee_category).exclude(
+        leave_balances__category_id=grant.category_id
+    ).order_by('id').values_list('id', flat=True)
+    created = 0
+    last_id = 0
+    while True:
+        # Keyset pagination, so each chunk is an indexed range scan.
+        user_ids = list(users.filter(id__gt=last_id)[:chunk_size])
+        if not user_ids:
+            return created
+        created += _create_balances([(user_id, grant.category_id, grant.allocated_hours) for user_id in user_ids])
+        last_id = user_ids[-1]
+
+
+def provision_balances(grants=None, chunk_size=1000):
+    """Create missing balances for all grants (or the given ones). Returns the number created."""
+    if grants is None:
+        grants = Grant.objects.all()
+    return sum(provision_grant(grant, chunk_size=chunk_size) for grant in grants)
+
+
+def provision_user(user):
+    """Create any balances the user's role is granted but the user does not have yet."""
+    grants = get_grants_for_role(user.role)
+    if not grants:
+        return 0
+    existing = set(UserLeaveBalance.objects.filter(user=user).values_list('category_id', flat=True))
+    return _create_balances([
+        (user.pk, category_id, grant.allocated_hours)
+        for category_id, grant in grants.items()
+        if category_id not in existing
+    ])
@@ -0,0 +1,126 @@
+from django.db import transaction
+from django.db.models import DEFERRED
+from django.db.models.signals import post_save, post_delete, pre_save, m2m_changed
+
+from . import aggregates, provisioning
+from .models import (
+    Category, Grant, Location, Request, User, RESTRICTION_CLASSES,
+    clear_restriction_ruleset_cache, invalidate_grant_cache,
+)
+
+
+# ---------------------------
+# Restriction ruleset invalidation
+# Any change to a restriction, its category/location links, or a deleted
+# category/location (whose links are removed by cascade) drops the cached
+# compiled rulesets used by Request.clean(), in every process. As with
+# Grants, the version is bumped again on commit.
+# ---------------------------
+def invalidate_restriction_rulesets(sender, **kwargs):
+    clear_restriction_ruleset_cache()
+    transaction.on_commit(clear_restriction_ruleset_cache)
+
+
+for RestrictionClass in RESTRICTION_CLASSES:
+    post_save.connect(invalidate_restriction_rulesets, sender=RestrictionClass)
+    post_delete.connect(invalidate_restriction_rulesets, sender=RestrictionClass)
+    m2m_changed.connect(invalidate_restriction_rulesets, sender=RestrictionClass.category.through)
+    m2m_changed.connect(invalidate_restriction_rulesets, sender=RestrictionClass.location.through)
+
+post_delete.connect(invalidate_restriction_rulesets, sender=Category)
+post_delete.connect(invalidate_restriction_rulesets, sender=Location)
+
+
+# ---------------------------
+# Request status transitions
+# Keep the derived tables in leave.aggregates in step with every saved or
+# deleted Request. Request.save() runs inside a transaction, so these
+# updates commit or roll back together with the request itself.
+# ---------------------------
+def capture_request_state(sender, instance, **kwargs):
+    # Instances built by hand (or loaded with deferred fields) have no loaded state.
+    if instance.pk and getattr(instance, '_loaded_state', None) is None:
+        instance._loaded_state = instance.stored_state()
+
+
+def request_saved(sender, instance, created, **kwargs):
+    old_state = None if created else getattr(instance, '_loaded_state', None)
+    new_state = instance.tracked_state()
+    aggregates.apply_request_change(old_state, new_state)
+    instance._loaded_state = new_state
+
+
+def request_deleted(sender, instance, **kwargs):
+    old_state = getattr(instance, '_loaded_state', None) or instance.tracked_state()
+    aggregates.apply_request_change(old_state, None)
+
+
+pre_save.connect(capture_request_state, sender=Request)
+post_save.connect(request_saved, sender=Request)
+post_delete.connect(request_deleted, sender=Request)
+
+
+# ---------------------------
+# Employee location changes
+# ---------------------------
+def capture_user_location(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and 'location' not in update_fields and 'location_id' not in update_fields:
+        return
+    if instance.pk and getattr(instance, '_loaded_location_id', DEFERRED) is DEFERRED:
+        instance._loaded_location_id = User.objects.filter(pk=instance.pk).values_list('location_id', flat=True).first()
+
+
+def user_saved(sender, instance, created, update_fields=None, **kwargs):
+    if update_fields is not None and 'location' not in update_fields and 'location_id' not in update_fields:
+        return
+    old_location_id = None if created else getattr(instance, '_loaded_location_id', None)
+    aggregates.apply_location_change(instance.pk, old_location_id, instance.location_id)
+    instance._loaded_location_id = instance.location_id
+
+
+def user_deleted(sender, instance, **kwargs):
+    # The user's requests were deleted (and un-counted) before the user row.
+    if instance.location_id is not None:
+        aggregates.apply_location_change(instance.pk, instance.location_id, None)
+
+
+pre_save.connect(capture_user_location, sender=User)
+post_save.connect(user_saved, sender=User)
+post_delete.connect(user_deleted, sender=User)
+
+
+# ---------------------------
+# Grant cache invalidation
+# Grants are cached per process (see models.get_grant); any change to a
+# grant or to a category name bumps the shared version so every process
+# reloads. It is bumped again on commit, since another process may have
+# reloaded the old rows while the transaction was still open.
+# ---------------------------
+def invalidate_grants(sender, **kwargs):
+    invalidate_grant_cache()
+    transaction.on_commit(invalidate_grant_cache)
+
+
+post_save.connect(invalidate_grants, sender=Grant)
+post_delete.connect(invalidate_grants, sender=Grant)
+post_save.connect(invalidate_grants, sender=Category)
+post_delete.connect(invalidate_grants, sender=Category)
+
+
+# ---------------------------
+# Balance provisioning
+# A new or changed Grant provisions the balances it covers once the
+# surrounding transaction commits; a new user, or one whose role may have
+# changed, gets the balances their role is granted.
+# ---------------------------
+def grant_saved(sender, instance, **kwargs):
+    transaction.on_commit(lambda: provisioning.provision_grant(instance))
+
+
+def user_provisioned(sender, instance, created, update_fields=None, **kwargs):
+    if created or update_fields is None or 'role' in update_fields:
+        provisioning.provision_user(instance)
+
+
+post_save.connect(grant_saved, sender=Grant)
+post_save.connect(user_provisioned, sender=User)
@@ -0,0 +1,60 @@
+// Availability hints for the request editor.
+// Fetches which days of the coming horizon would pass validation for the
+// selected category, then warns about unavailable days in the chosen range.
+(function () {
+  var form = document.getElementById('request-form');
+  if (!form || !form.dataset.availabilityUrl) {
+    return;
+  }
+  var category = form.querySelector('[name="category"]');
+  var hoursPerDay = form.querySelector('[name="hours_per_day"]');
+  var startDate = form.querySelector('[name="start_date"]');
+  var endDate = form.querySelector('[name="end_date"]');
+  var message = document.getElementById('availability-message');
+  var cache = {};
+
+  function fetchAvailability() {
+    var key = category.value + ':' + (hoursPerDay.value || 8);
+    if (!category.value) {
+      return Promise.resolve(null);
+    }
+    if (!cache[key]) {
+      var url = form.dataset.availabilityUrl + '?category=' + encodeURIComponent(category.value) +
+        '&hours_per_day=' + encodeURIComponent(hoursPerDay.value || 8);
+      cache[key] = fetch(url, {credentials: 'same-origin'})
+        .then(function (response) { return response.ok ? response.json() : null; })
+        .then(function (data) {
+          var days = {};
+          if (data) {
+            data.days.forEach(function (day) { days[day.date] = day; });
+          }
+          return days;
+        });
+    }
+    return cache[key];
+  }
+
+  function update() {
+    fetchAvailability().then(function (days) {
+      message.textContent = '';
+      if (!days || !startDate.value) {
+        return;
+      }
+      var last = endDate.value || startDate.value;
+      var blocked = Object.keys(days).filter(function (date) {
+        return date >= startDate.value && date <= last && !days[date].available;
+      });
+      if (blocked.length) {
+        message.textContent = 'Unavailable: ' + blocked.map(function (date) {
+          return date + ' (' + days[date].errors.join(' ') + ')';
+        }).join('; ');
+      }
+    });
+  }
+
+  [category, hoursPerDay, startDate, endDate].forEach(function (field) {
+    if (field) {
+      field.addEventListener('change', update);
+    }
+  });
+})();
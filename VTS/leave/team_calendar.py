@@ -0,0 +1,98 @@
+"""
+Team absence calendar for managers: one row per subordinate, one column
+per day, built from a single interval query over Request.
+
+Each subordinate's leave is expanded into two day bitmaps (Python ints,
+bit n = n-th day of the window), one for approved and one for submitted
+requests, so filling the grid costs one shift-and-mask per request
+instead of one date comparison per cell. The rendered grid is cached
+under a key that includes the team and the time of the team's latest
+request change, so any change to a request shows up immediately.
+"""
+import datetime
+import hashlib
+
+from django.core.cache import cache
+from django.db.models import Count, Max
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from .models import Request
+
+SPANS = {'month': 1, 'quarter': 3}
+CACHE_SECONDS = 60 * 60
+
+
+def add_months(day, months):
+    month_index = day.month - 1 + months
+    return datetime.date(day.year + month_index // 12, month_index % 12 + 1, 1)
+
+
+def day_bitmaps(intervals, window_start, window_end):
+    """
+    Turn (employee_id, start_date, end_date, status) rows into
+    {employee_id: {'approved': bits, 'submitted': bits}}, clipped to the window.
+    """
+    bitmaps = {}
+    for employee_id, start_date, end_date, status in intervals:
+        first = (max(start_date, window_start) - window_start).days
+        last = (min(end_date, window_end) - window_start).days
+        if last < first:
+            continue
+        bits = bitmaps.setdefault(employee_id, {'approved': 0, 'submitted': 0})
+        bits[status] |= ((1 << (last - first + 1)) - 1) << first
+    return bitmaps
+
+
+# The cells are the bulk of the grid (e.g., 200 x 92 for a quarter), so
+# they are joined here rather than looped over in the template.
+CELL_HTML = {
+    css_class: f'<td class="{css_class}"></td>' if css_class else '<td></td>'
+    for css_class in ('leave-approved', 'leave-submitted', 'weekend', '')
+}
+
+
+def _grid_rows(team, bitmaps, days):
+    """Rows of (username, safe HTML of the row's day cells)."""
+    weekend = [day.weekday() >= 5 for day in days]
+    rows = []
+    for employee_id, username in team:
+        bits = bitmaps.get(employee_id, {'approved': 0, 'submitted': 0})
+        approved, submitted = bits['approved'], bits['submitted']
+        cells = []
+        for index in range(len(days)):
+            mask = 1 << index
+            if approved & mask:
+                cells.append(CELL_HTML['leave-approved'])
+            elif submitted & mask:
+                cells.append(CELL_HTML['leave-submitted'])
+            else:
+                cells.append(CELL_HTML['weekend' if weekend[index] else ''])
+        rows.append((username, mark_safe(''.join(cells))))
+    return rows
+
+
+def render_team_calendar(manager, window_start, span):
+    """Return the rendered grid for the manager's team, from the cache when nothing changed."""
+    window_end = add_months(window_start, SPANS[span]) - datetime.timedelta(days=1)
+    team = list(manager.subordinates.order_by('username').values_list('id', 'username'))
+    team_requests = Request.objects.filter(employee__in=manager.subordinates.values('id'))
+
+    # Version on the team's latest request change; the count catches deletions.
+    version = team_requests.aggregate(latest=Max('updated_at'), total=Count('id'))
+    fingerprint = hashlib.sha1(repr((team, version['latest'], version['total'])).encode()).hexdigest()
+    key = f'leave:team-calendar:{manager.pk}:{window_start.isoformat()}:{span}:{fingerprint}'
+    html = cache.get(key)
+    if html is not None:
+        return html
+
+    intervals = team_requests.filter(
+        status__in=Request.ACTIVE_STATUSES, start_date__lte=window_end, end_date__gte=window_start
+    ).values_list('employee_id', 'start_date', 'end_date', 'status')
+    days = [window_start + datetime.timedelta(days=offset) for offset in range((window_end - window_start).days + 1)]
+    html = render_to_string('vts/team_calendar_grid.html', {
+        'days': days,
+        'rows': _grid_rows(team, day_bitmaps(intervals, window_start, window_end), days),
+    })
+    cache.set(key, html, CACHE_SECONDS)
+    return html
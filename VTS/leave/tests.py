@@ -1,3 +1,571 @@
-from django.test import TestCase
+import csv
+import datetime
+import io
+import os
+import random
+import re
+import tempfile
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.core import mail
+from django.core.mail.backends.locmem import EmailBackend as LocmemEmailBackend
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings, tag
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import (
+    Category, ConsecutiveDayRestriction, EmployeePeriodHours, Grant, JobCheckpoint, LeaveBalanceSnapshot,
+    LeaveLedgerEntry, Location, OutboxEmail, Request, User, UserLeaveBalance, UtilizationRollup, current_leave_year,
+    get_grant, get_restriction_ruleset,
+)
+from . import accrual, aggregates, bulk_import, outbox
+from .provisioning import _create_balances, provision_balances
+from .views import HOME_PAGE_SIZE, home
+
+
+class RestrictionRulesetCacheTests(TestCase):
+    def test_rolled_back_restriction_is_not_cached(self):
+        category = Category.objects.create(name="Vacation")
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            restriction = ConsecutiveDayRestriction.objects.create(name="streak", parameters={'max_consecutive_days': 1})
+            restriction.category.add(category)
+            self.assertEqual(len(get_restriction_ruleset(category.pk, None)), 1)
+            raise RuntimeError("roll back")
+        self.assertEqual(get_restriction_ruleset(category.pk, None), ())
+
+    def test_committed_restriction_is_seen(self):
+        category = Category.objects.create(name="Vacation")
+        self.assertEqual(get_restriction_ruleset(category.pk, None), ())
+        restriction = ConsecutiveDayRestriction.objects.create(name="streak", parameters={'max_consecutive_days': 1})
+        restriction.category.add(category)
+        self.assertEqual([r.pk for r in get_restriction_ruleset(category.pk, None)], [restriction.pk])
+
+
+
+class GrantCacheTests(TestCase):
+    def test_rolled_back_grant_is_not_cached(self):
+        category = Category.objects.create(name="Vacation")
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            Grant.objects.create(employee_category='employee', category=category, allocated_hours=40)
+            self.assertEqual(get_grant('employee', category.pk).allocated_hours, 40)
+            raise RuntimeError("roll back")
+        self.assertIsNone(get_grant('employee', category.pk))
+
+    def test_committed_grant_is_seen(self):
+        category = Category.objects.create(name="Vacation")
+        self.assertIsNone(get_grant('employee', category.pk))
+        grant = Grant.objects.create(employee_category='employee', category=category, allocated_hours=40)
+        self.assertEqual(get_grant('employee', category.pk), grant)
+
+@tag('slow')
+@skipUnless(connection.vendor == 'sqlite', "reads SQLite's EXPLAIN QUERY PLAN output")
+class RequestIndexPlanTests(TestCase):
+    """
+    Seed many requests (LEAVE_EXPLAIN_ROWS, default 1M) and check that each
+    hot query searches leave_request through the index meant for it.
+    Excluded from routine runs with --exclude-tag slow.
+    """
+    day = datetime.date(2025, 6, 1)
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(42)
+        locations = Location.objects.bulk_create(Location(name=f"site {i}") for i in range(50))
+        category = Category.objects.create(name="vacation")
+        User.objects.bulk_create(
+            (User(username=f"explain-{i}", location=rng.choice(locations)) for i in range(20_000)),
+            batch_size=5000,
+        )
+        employee_ids = list(User.objects.values_list('id', flat=True))
+        cls.manager = User.objects.create(username="explain-manager", role='manager')
+        cls.manager.subordinates.add(*employee_ids[:25])
+
+        origin = datetime.date(2020, 1, 1)
+        statuses = [status for status, _ in Request.STATUS_CHOICES]
+        batch = []
+        for _ in range(int(os.environ.get('LEAVE_EXPLAIN_ROWS', 1_000_000))):
+            begin = origin + datetime.timedelta(days=rng.randrange(0, 3650))
+            batch.append(Request(
+                employee_id=rng.choice(employee_ids), category=category, title="seeded", start_date=begin,
+                end_date=begin + datetime.timedelta(days=rng.randrange(0, 10)), hours_per_day=8,
+                status=rng.choice(statuses),
+            ))
+            if len(batch) == 10_000:
+                Request.objects.bulk_create(batch)
+                batch = []
+        Request.objects.bulk_create(batch)
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+        cls.employee_id = employee_ids[0]
+        cls.location_id = locations[0].pk
+
+    def assertSearchesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertRegex(plan, rf'SEARCH leave_request USING (?:COVERING )?INDEX {re.escape(index_name)}\b')
+
+    def test_overlap_check(self):
+        self.assertSearchesIndex(
+            Request.objects.filter(employee_id=self.employee_id, start_date__lte=self.day, end_date__gte=self.day),
+            'request_employee_dates_idx',
+        )
+
+    def test_own_submitted_requests(self):
+        self.assertSearchesIndex(
+            Request.objects.filter(employee_id=self.employee_id, status='submitted'),
+            'request_employee_status_idx',
+        )
+
+    def test_subordinates_submitted_requests(self):
+        self.assertSearchesIndex(
+            Request.objects.filter(employee__id__in=self.manager.subordinates.values_list('id', flat=True), status='submitted'),
+            'request_employee_status_idx',
+        )
+
+    def test_active_leave_at_location(self):
+        self.assertSearchesIndex(
+            Request.objects.filter(
+                employee__location=self.location_id, start_date__lte=self.day, end_date__gte=self.day,
+                status__in=['submitted', 'approved'],
+            ),
+            'request_employee_dates_idx',
+        )
+
+
+
+class HomeQueryTests(TestCase):
+    """The manager dashboard costs the same three queries whatever the data size."""
+
+    def seed(self, subordinates):
+        location = Location.objects.create(name="site")
+        category = Category.objects.create(name="Vacation")
+        manager = User.objects.create(username="manager", role='manager', location=location)
+        employees = User.objects.bulk_create(User(username=f"employee-{i}", location=location) for i in range(subordinates))
+        manager.subordinates.add(*employees)
+        today = timezone.now().date()
+        # bulk_create skips full_clean() and the signals; only the rendered rows matter here.
+        Request.objects.bulk_create(
+            Request(
+                employee=employee, category=category, title=f"trip {n}", hours_per_day=8, status='submitted',
+                start_date=today + datetime.timedelta(days=7 * n), end_date=today + datetime.timedelta(days=7 * n),
+            )
+            for employee in employees + [manager] for n in range(2)
+        )
+        return manager
+
+    def render(self, manager, params=None):
+        """Render the dashboard in 3 queries; returns the team table's next-page cursor or None."""
+        request = RequestFactory().get('/leave/', params or {})
+        # Fresh instance, as the auth middleware would load it.
+        request.user = User.objects.get(pk=manager.pk)
+        with self.assertNumQueries(3):
+            response = home(request)
+        self.assertEqual(response.status_code, 200)
+        next_link = re.search(r'[?&]team=([\w-]+)', response.content.decode())
+        return next_link.group(1) if next_link else None
+
+    def test_single_subordinate(self):
+        self.assertIsNone(self.render(self.seed(1)))
+
+    def test_paged_team(self):
+        manager = self.seed(HOME_PAGE_SIZE + 15)
+        cursor = self.render(manager)
+        self.assertIsNotNone(cursor)
+        self.render(manager, {'team': cursor})
+
+class RequestAvailabilityTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="employee", password="x")
+        cls.category = Category.objects.create(name="Vacation")
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def availability(self, hours_per_day):
+        return self.client.get(reverse('request_availability'), {
+            'category': self.category.pk, 'horizon': 3, 'hours_per_day': hours_per_day,
+        })
+
+    def test_rejects_hours_per_day_out_of_range(self):
+        for hours_per_day in ('0', '-4', '24.5', 'nan', 'inf'):
+            with self.subTest(hours_per_day=hours_per_day):
+                self.assertEqual(self.availability(hours_per_day).status_code, 400)
+
+    def test_accepts_part_days(self):
+        response = self.availability('4.5')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['days']), 3)
+
+
+class MetricsEndpointTests(TestCase):
+    def test_local_anonymous_client_is_refused(self):
+        # The test client connects from 127.0.0.1.
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+
+    @override_settings(LEAVE_METRICS_TOKEN='s3cret')
+    def test_bearer_token(self):
+        self.assertEqual(self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer s3cret').status_code, 200)
+        self.assertEqual(self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+
+    def test_staff_user(self):
+        self.client.force_login(User.objects.create_user(username="admin", password="x", is_staff=True))
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 200)
+
+
+class FractionalBalanceTests(TestCase):
+    def test_part_day_debit_is_kept_exactly(self):
+        category = Category.objects.create(name="Vacation")
+        Grant.objects.create(employee_category='employee', category=category, allocated_hours=40)
+        user = User.objects.create_user(username="employee", password="x")
+        balance = UserLeaveBalance.objects.get(user=user, category=category)
+        request = Request.objects.create(
+            employee=user, category=category, title="dentist", start_date=datetime.date(2026, 3, 2),
+            end_date=datetime.date(2026, 3, 2), hours_per_day=4.5, status='submitted',
+        )
+        self.assertTrue(UserLeaveBalance.rebook_request(request, 4.5))
+        balance.refresh_from_db()
+        self.assertEqual(balance.remaining_hours, 35.5)
+        # The balance agrees with the ledger, so reconciling finds nothing to do.
+        call_command('reconcile_ledger', stdout=io.StringIO())
+
+
+
+class ReconcileLedgerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name="Vacation")
+        Grant.objects.create(employee_category='employee', category=cls.category, allocated_hours=40)
+        cls.user = User.objects.create_user(username="employee", password="x")
+
+    def book(self, hours):
+        day = datetime.date(2026, 3, 2) + datetime.timedelta(days=Request.objects.count())
+        request = Request.objects.create(
+            employee=self.user, category=self.category, title="leave", start_date=day, end_date=day,
+            hours_per_day=hours, status='submitted',
+        )
+        self.assertTrue(UserLeaveBalance.rebook_request(request, hours))
+
+    def reconcile(self, *args):
+        call_command('reconcile_ledger', *args, stdout=io.StringIO())
+
+    def test_snapshot_replaces_older_ones(self):
+        self.book(8)
+        self.reconcile('--snapshot')
+        self.book(4)
+        self.reconcile('--snapshot')
+        snapshot = LeaveBalanceSnapshot.objects.get(user=self.user, category=self.category)
+        self.assertEqual(snapshot.balance, 28)
+        self.assertEqual(snapshot.last_entry_id, LeaveLedgerEntry.objects.latest('id').pk)
+
+    def test_reads_start_from_the_latest_snapshot(self):
+        self.book(8)
+        self.reconcile('--snapshot')
+        self.book(4)
+        self.reconcile()
+        LeaveBalanceSnapshot.objects.update(balance=0)
+        with self.assertRaises(CommandError):
+            self.reconcile()
+        # --full ignores the snapshot and sums the whole ledger.
+        self.reconcile('--full')
+
+
+class ProvisioningTests(TestCase):
+    def test_counts_only_inserted_balances(self):
+        category = Category.objects.create(name="Vacation")
+        users = [User.objects.create_user(username=f"employee-{i}", password="x") for i in range(3)]
+        Grant.objects.create(employee_category='employee', category=category, allocated_hours=40)
+        self.assertEqual(provision_balances(), 3)
+        self.assertEqual(provision_balances(), 0)
+        UserLeaveBalance.objects.filter(user=users[0]).delete()
+        self.assertEqual(provision_balances(), 1)
+        # Pairs that already have a balance (e.g. inserted by a concurrent run) are not counted.
+        UserLeaveBalance.objects.filter(user=users[1]).delete()
+        pairs = [(user.pk, category.pk, 40) for user in users[:2]]
+        self.assertEqual(_create_balances(pairs), 1)
+        self.assertEqual(UserLeaveBalance.objects.count(), 3)
+        self.assertEqual(LeaveLedgerEntry.objects.filter(kind='grant').count(), 3)
+
+
+class RollBalanceTests(SimpleTestCase):
+    as_of = datetime.date(2026, 1, 1)
+
+    def roll(self, remaining, grant, period_year=2025):
+        return accrual.roll_balance(remaining, grant, 2026, period_year, self.as_of)
+
+    def test_carryover_is_capped(self):
+        grant = Grant(allocated_hours=40, max_carryover_hours=8)
+        self.assertEqual(self.roll(20, grant), (40, 48, 12, 40))
+        self.assertEqual(self.roll(5, grant), (40, 45, 0, 40))
+        self.assertEqual(self.roll(-4, grant), (40, 36, 0, 40))
+
+    def test_no_cap_carries_everything(self):
+        self.assertEqual(self.roll(20, Grant(allocated_hours=40)), (40, 60, 0, 40))
+
+    def test_already_rolled(self):
+        self.assertIsNone(self.roll(20, Grant(allocated_hours=40), period_year=2026))
+
+    def test_expired_grant_forfeits_what_is_left(self):
+        grant = Grant(allocated_hours=40, expiration_date=datetime.date(2025, 12, 31))
+        self.assertEqual(self.roll(20, grant), (0, 0, 20, 0))
+        # Within the year only the hours are forfeited; the allocation stays.
+        self.assertEqual(self.roll(20, grant, period_year=2026), (None, 0, 20, 0))
+        self.assertIsNone(self.roll(0, grant, period_year=2026))
+
+    def test_grant_removed(self):
+        self.assertEqual(self.roll(20, None), (0, 20, 0, 0))
+
+
+class RolloverResumeTests(TestCase):
+    def test_interrupted_rollover_resumes_without_rolling_twice(self):
+        category = Category.objects.create(name="Vacation")
+        Grant.objects.create(employee_category='employee', category=category, allocated_hours=40, max_carryover_hours=8)
+        for i in range(5):
+            User.objects.create_user(username=f"employee-{i}", password="x")
+        provision_balances()
+        UserLeaveBalance.objects.update(remaining_hours=20)
+        year = current_leave_year() + 1
+
+        real_roll_chunk = accrual._roll_chunk
+        calls = []
+
+        def crash_on_third_chunk(*args):
+            calls.append(args)
+            if len(calls) == 3:
+                raise RuntimeError("worker died")
+            return real_roll_chunk(*args)
+
+        with mock.patch.object(accrual, '_roll_chunk', crash_on_third_chunk), self.assertRaises(RuntimeError):
+            accrual.run_rollover(year, datetime.date(year, 1, 1), chunk_size=2)
+        checkpoint = JobCheckpoint.objects.get(name=f'rollover:{year}')
+        self.assertFalse(checkpoint.finished)
+        self.assertEqual(UserLeaveBalance.objects.filter(period_year=year).count(), 4)
+
+        self.assertEqual(accrual.run_rollover(year, datetime.date(year, 1, 1), chunk_size=2), 1)
+        checkpoint.refresh_from_db()
+        self.assertTrue(checkpoint.finished)
+        self.assertEqual(
+            set(UserLeaveBalance.objects.values_list('allocated_hours', 'remaining_hours', 'period_year')),
+            {(40, 48, year)},
+        )
+        # Exactly one expiry and one new grant per balance, on top of the opening grants.
+        self.assertEqual(LeaveLedgerEntry.objects.filter(kind='expiry', hours=-12).count(), 5)
+        self.assertEqual(LeaveLedgerEntry.objects.filter(kind='grant').count(), 10)
+        # Rerunning a finished year changes nothing.
+        self.assertEqual(accrual.run_rollover(year, datetime.date(year, 1, 1), chunk_size=2), 0)
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+class OutboxTests(TestCase):
+    def enqueue(self, recipient="employee@example.com"):
+        return OutboxEmail.enqueue("Leave approved", "Enjoy.", [recipient])
+
+    def make_due(self):
+        OutboxEmail.objects.filter(status='pending').update(next_attempt_at=timezone.now())
+
+    def assertRetryScheduled(self, email, before, delay):
+        email.refresh_from_db()
+        self.assertEqual(email.status, 'pending')
+        self.assertGreaterEqual(email.next_attempt_at, before + datetime.timedelta(seconds=delay))
+        self.assertLessEqual(email.next_attempt_at, timezone.now() + datetime.timedelta(seconds=delay))
+
+    def test_sends_due_email(self):
+        email = self.enqueue()
+        self.assertEqual(outbox.drain(), (1, 0))
+        self.assertEqual([(m.subject, m.to) for m in mail.outbox], [("Leave approved", ["employee@example.com"])])
+        email.refresh_from_db()
+        self.assertEqual(email.status, 'sent')
+        self.assertIsNotNone(email.sent_at)
+        self.assertIsNone(outbox.send_batch())
+
+    def test_unreachable_server_backs_off_exponentially(self):
+        email = self.enqueue()
+        with mock.patch.object(LocmemEmailBackend, 'open', side_effect=ConnectionRefusedError("connection refused")):
+            before = timezone.now()
+            self.assertEqual(outbox.drain(), (0, 1))
+            self.assertRetryScheduled(email, before, 60)
+            self.assertEqual(email.attempts, 1)
+            self.assertEqual(email.last_error, "connection refused")
+            # Not due yet, so nothing is attempted.
+            self.assertIsNone(outbox.send_batch())
+
+            self.make_due()
+            before = timezone.now()
+            outbox.drain()
+            self.assertRetryScheduled(email, before, 120)
+            self.assertEqual(email.attempts, 2)
+        self.make_due()
+        self.assertEqual(outbox.drain(), (1, 0))
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_retry_delay_is_capped(self):
+        self.assertEqual([outbox.retry_delay(n) for n in (1, 2, 3)], [60, 120, 240])
+        self.assertEqual(outbox.retry_delay(20), outbox.RETRY_MAX_SECONDS)
+
+    def test_failed_message_does_not_hold_back_the_batch(self):
+        bad = self.enqueue("bounce@example.com")
+        good = self.enqueue()
+        real_send = LocmemEmailBackend.send_messages
+
+        def send_messages(backend, messages):
+            if messages[0].to == ["bounce@example.com"]:
+                raise OSError("mailbox unavailable")
+            return real_send(backend, messages)
+
+        with mock.patch.object(LocmemEmailBackend, 'send_messages', send_messages):
+            self.assertEqual(outbox.drain(), (1, 1))
+        bad.refresh_from_db()
+        good.refresh_from_db()
+        self.assertEqual((bad.status, bad.attempts), ('pending', 1))
+        self.assertEqual(good.status, 'sent')
+
+    def test_gives_up_after_max_attempts(self):
+        email = self.enqueue()
+        with mock.patch.object(LocmemEmailBackend, 'open', side_effect=ConnectionRefusedError("connection refused")):
+            for _ in range(2):
+                outbox.drain(max_attempts=3)
+                self.make_due()
+            with self.assertLogs('leave.outbox', 'ERROR'):
+                outbox.drain(max_attempts=3)
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), ('dead', 3))
+        self.assertIsNone(outbox.send_batch())
+        self.assertEqual(mail.outbox, [])
+
+    def test_claimed_email_is_leased(self):
+        email = self.enqueue()
+        self.assertEqual(outbox._claim_batch(10), [email])
+        # A second worker finds nothing due while the lease runs.
+        self.assertEqual(outbox._claim_batch(10), [])
+        self.assertIsNone(outbox.send_batch())
+        # Once the lease of a crashed worker runs out, the email is sent.
+        OutboxEmail.objects.filter(pk=email.pk).update(
+            next_attempt_at=timezone.now() - datetime.timedelta(seconds=1)
+        )
+        self.assertEqual(outbox.drain(), (1, 0))
+        self.assertEqual(len(mail.outbox), 1)
+
+
+class ImportRequestsTests(TestCase):
+    # Lines 2-11 of the CSV; with chunks of three the third chunk (lines 8-10) crashes once.
+    ROWS = [
+        ('alice', '2026-01-05', '2026-01-07', '8', 'approved'),
+        ('bob', '2026-01-30', '2026-02-03', '7.5', 'submitted'),
+        ('nobody', '2026-01-05', '2026-01-05', '8', 'approved'),  # Unknown employee.
+        ('carol', '2026-02-10', '2026-02-10', '4', 'approved'),
+        ('alice', '2026-01-06', '2026-01-06', '8', 'approved'),  # Overlaps line 2.
+        ('dave', '2026-02-02', '2026-02-04', '8', 'approved'),  # No location.
+        ('alice', '2026-01-20', '2026-01-22', '8', 'approved'),  # Same month as line 2.
+        ('bob', '2026-02-16', '2026-02-16', '24.5', 'approved'),  # Too many hours.
+        ('carol', '2026-02-11', '2026-02-12', '8', 'submitted'),  # Same week as line 5.
+        ('erin', '2026-03-30', '2026-04-02', '8', 'approved'),
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        location = Location.objects.create(name="site")
+        Category.objects.create(name="Vacation")
+        for username in ('alice', 'bob', 'carol', 'erin'):
+            User.objects.create_user(username=username, password="x", location=location)
+        User.objects.create_user(username="dave", password="x")
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'requests.csv')
+        with open(self.path, 'w', newline='', encoding='utf-8') as handle:
+            writer = csv.writer(handle)
+            writer.writerow(['employee', 'category', 'title', 'start_date', 'end_date', 'hours_per_day', 'status'])
+            for employee, start_date, end_date, hours_per_day, status in self.ROWS:
+                writer.writerow([employee, 'Vacation', 'imported', start_date, end_date, hours_per_day, status])
+
+    def derived_tables(self):
+        return (
+            set(EmployeePeriodHours.objects.exclude(hours=0).values_list(
+                'employee_id', 'category_id', 'period', 'period_start', 'hours'
+            )),
+            set(UtilizationRollup.objects.exclude(taken_hours=0, pending_hours=0).values_list(
+                'category_id', 'location_id', 'month', 'taken_hours', 'pending_hours'
+            )),
+        )
+
+    def test_interrupted_import_resumes(self):
+        real_import_chunk = bulk_import._import_chunk
+        calls = []
+
+        def crash_on_third_chunk(*args):
+            calls.append(args)
+            if len(calls) == 3:
+                raise RuntimeError("worker died")
+            return real_import_chunk(*args)
+
+        with mock.patch.object(bulk_import, '_import_chunk', crash_on_third_chunk), self.assertRaises(RuntimeError):
+            bulk_import.import_requests(self.path, chunk_size=3)
+        checkpoint = JobCheckpoint.objects.get(name=f'import_requests:{os.path.abspath(self.path)}')
+        self.assertEqual((checkpoint.position, checkpoint.finished), (7, False))
+        self.assertEqual(Request.objects.count(), 4)
+
+        self.assertEqual(bulk_import.import_requests(self.path, chunk_size=3), (3, 1))
+        checkpoint.refresh_from_db()
+        self.assertTrue(checkpoint.finished)
+        self.assertEqual(Request.objects.count(), 7)
+
+        with open(f"{self.path}.errors.csv", newline='', encoding='utf-8') as report:
+            rows = list(csv.reader(report))
+        self.assertEqual(rows[0], ['line', 'errors', 'row'])
+        self.assertEqual([row[0] for row in rows[1:]], ['4', '6', '9'])
+        self.assertIn("Unknown employee 'nobody'.", rows[1][1])
+        self.assertIn("overlaps", rows[2][1])
+        self.assertIn("hours_per_day", rows[3][1])
+
+        # Every chunk kept the derived tables in step with the requests.
+        self.assertEqual(aggregates.check_staffing(), [])
+        imported = self.derived_tables()
+        aggregates.rebuild_period_hours()
+        aggregates.rebuild_utilization()
+        self.assertEqual(imported, self.derived_tables())
+
+    def test_interrupted_import_resumes_without_upsert(self):
+        # Databases without INSERT ... ON CONFLICT take the UPDATE path.
+        with mock.patch.object(connection.features, 'supports_update_conflicts_with_target', False):
+            self.test_interrupted_import_resumes()
+
+class OpenLedgerMigrationTests(TransactionTestCase):
+    """0008 links the opening debits to the requests already holding hours."""
+    before = [('leave', '0007_request_indexes')]
+
+    def setUp(self):
+        executor = MigrationExecutor(connection)
+        self.latest = executor.loader.graph.leaf_nodes('leave')
+        executor.migrate(self.before)
+        self.addCleanup(lambda: MigrationExecutor(connection).migrate(self.latest))
+        apps = executor.loader.project_state(self.before).apps
+        category = apps.get_model('leave', 'Category').objects.create(name="Vacation")
+        user = apps.get_model('leave', 'User').objects.create(username="legacy")
+        apps.get_model('leave', 'UserLeaveBalance').objects.create(
+            user=user, category=category, allocated_hours=40, remaining_hours=20,
+        )
+        LegacyRequest = apps.get_model('leave', 'Request')
+        day = datetime.date(2026, 3, 2)
+        fields = dict(employee=user, category=category, title="legacy", start_date=day, end_date=day)
+        self.approved = LegacyRequest.objects.create(hours_per_day=8, status='approved', **fields).pk
+        self.submitted = LegacyRequest.objects.create(hours_per_day=4, status='submitted', **fields).pk
+        LegacyRequest.objects.create(hours_per_day=8, status='withdrawn', **fields)
+        self.user_id, self.category_id = user.pk, category.pk
+
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.latest)
+
+    def test_debits_are_linked_to_active_requests(self):
+        entries = LeaveLedgerEntry.objects.filter(user_id=self.user_id, category_id=self.category_id)
+        self.assertCountEqual(entries.values_list('kind', 'hours', 'request_id'), [
+            ('grant', 40, None), ('debit', -8, self.approved), ('debit', -4, self.submitted), ('debit', -8, None),
+        ])
+
+    def test_withdrawing_a_legacy_request_refunds_its_hours(self):
+        self.assertEqual(UserLeaveBalance.refund_request(Request.objects.get(pk=self.approved)), 8)
+        balance = UserLeaveBalance.objects.get(user_id=self.user_id, category_id=self.category_id)
+        self.assertEqual(balance.remaining_hours, 28)
+        call_command('reconcile_ledger', stdout=io.StringIO())
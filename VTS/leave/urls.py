@@ -5,15 +5,31 @@ from . import views
 urlpatterns = [
     path('', views.home, name='home'),
     path('request_editor/', views.request_editor, name='request_editor'),
+    path('request_editor/availability/', views.request_availability, name='request_availability'),
     path('withdraw_request/<int:request_id>/', views.withdraw_request, name='withdraw_request'),
     path('cancel_request/<int:request_id>/', views.cancel_request, name='cancel_request'),
     path('edit_request/<int:request_id>/', views.edit_request, name='edit_request'),
     # Manager-specific URLs for approving or rejecting requests.
     path('approve_request/<int:request_id>/', views.approve_request, name='approve_request'),
     path('reject_request/<int:request_id>/', views.reject_request, name='reject_request'),
+    path('review_requests/', views.bulk_review_requests, name='bulk_review_requests'),
+    path('team/calendar/', views.team_calendar, name='team_calendar'),
+    # iCalendar feeds, addressed by a signed token instead of a login.
+    path('feeds/<str:token>/leave.ics', views.ics_feed, name='ics_feed'),
+    path('feeds/reset/', views.reset_feed_links, name='reset_feed_links'),
     # HR-specific URLs
     path('hr/restrictions/', views.hr_restriction_list, name='hr_restriction_list'),
     path('hr/restrictions/create/', views.hr_restriction_create, name='hr_restriction_create'),
+    path('hr/utilization/', views.hr_utilization_report, name='hr_utilization_report'),
+    # Streaming CSV/JSON Lines exports for payroll.
+    path('hr/exports/requests/', views.export_requests, name='export_requests'),
+    path('hr/exports/balances/', views.export_balances, name='export_balances'),
     # Future: paths for editing and deleting restrictions can be added.
     path('register/', views.register, name='register'), 
+    # Read-only JSON listings (keyset-paginated).
+    path('api/requests/mine/', views.api_my_requests, name='api_my_requests'),
+    path('api/requests/pending/', views.api_pending_requests, name='api_pending_requests'),
+    path('api/requests/', views.api_search_requests, name='api_search_requests'),
+    # Prometheus scrape target for restriction validation metrics.
+    path('metrics/', views.metrics_endpoint, name='metrics'),
 ]
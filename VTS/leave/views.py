@@ -1,18 +1,31 @@
 import datetime
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
+from django.urls import reverse
 from django.utils import timezone
-from .models import Request, User, Grant, UserLeaveBalance
+from django.utils.safestring import mark_safe
+from django.utils.cache import get_conditional_response
+from django.core import signing
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.views.decorators.http import require_POST
+from .models import Request, RequestState, User, UserLeaveBalance, Category, LeaveLedgerEntry, OutboxEmail, UtilizationRollup
+from . import aggregates, feeds
+from . import team_calendar as team_calendar_grid
 from .forms import RequestForm
+from .provisioning import provision_user
+from .pagination import InvalidCursor, encode_cursor, page_url, paginate, parse_cursor
 
 from django.contrib.auth import login
 from .forms import CustomUserCreationForm
 
 # For Manager functionality
-from django.http import HttpResponse
-from django.core.mail import send_mail
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 
 # FOr HR_clerk functionality
+import csv
+import heapq
+import itertools
 import json
 from django.shortcuts import render, redirect, get_object_or_404
 from django.http import HttpResponse
@@ -24,9 +37,32 @@ from .models import (
     CoworkerRestriction,
     DayOfWeekRestriction,
     PeriodLimitRestriction,
+    RESTRICTION_CLASSES,
+    Location,
 )
 
 from .forms import RestrictionForm
+from . import metrics
+
+# Longest window the availability endpoint will evaluate in one call.
+MAX_AVAILABILITY_HORIZON = 366
+
+
+# Rows per table on the home dashboard.
+HOME_PAGE_SIZE = 25
+
+
+def _home_page(request, queryset, ordering, param):
+    """One keyset page of a dashboard table; a bad cursor falls back to the first page."""
+    cursor = request.GET.get(param)
+    try:
+        page = paginate(queryset, ordering, cursor, HOME_PAGE_SIZE)
+    except InvalidCursor:
+        cursor = None
+        page = paginate(queryset, ordering, None, HOME_PAGE_SIZE)
+    page.next_url = page_url(request, param, page.next_cursor) if page.has_next else None
+    page.first_url = page_url(request, param, None) if cursor else None
+    return page
 
 
 @login_required
@@ -36,29 +72,36 @@ def home(request):
     six_months_ago = today - datetime.timedelta(days=180)
     eighteen_months_future = today + datetime.timedelta(days=18*30)  # approximate
 
-    # Retrieve employee's own requests in the defined time range.
+    # Only the columns the tables render.
+    request_columns = ('id', 'title', 'start_date', 'end_date', 'hours_per_day', 'status')
+
+    # Retrieve employee's own requests in the defined time range, latest first.
     my_requests = Request.objects.filter(
         employee=user,
         start_date__gte=six_months_ago,
         end_date__lte=eighteen_months_future
-    )
+    ).only(*request_columns)
 
     context = {
         'user': user,
         'current_date': today,
         'message': "Welcome to the Vacation Tracking System!",
-        'my_requests': my_requests,
+        'feed_url': request.build_absolute_uri(reverse('ics_feed', args=[feeds.feed_token(user, 'mine')])),
+        'my_requests': _home_page(request, my_requests, ('-start_date', '-id'), 'mine'),
     }
     
     # PendingForApprovalByYourManager: requests that the user has submitted (awaiting approval)
-    pending_for_manager = Request.objects.filter(employee=user, status='submitted')
-    context['pending_for_manager'] = pending_for_manager
+    pending_for_manager = Request.objects.filter(employee=user, status='submitted').only(*request_columns)
+    context['pending_for_manager'] = _home_page(request, pending_for_manager, ('start_date', 'id'), 'awaiting')
 
     # For managers: display subordinate requests pending their approval.
     if user.role == 'manager':
-        subordinate_ids = user.subordinates.values_list('id', flat=True)
-        pending_for_you = Request.objects.filter(employee__id__in=subordinate_ids, status='submitted')
-        context['pending_for_you'] = pending_for_you
+        # The subordinate ids go in as a subquery rather than a separate round trip.
+        pending_for_you = Request.objects.filter(
+            employee__in=user.subordinates.values('id'), status='submitted'
+        ).select_related('employee').only(*request_columns, 'employee__username')
+        context['pending_for_you'] = _home_page(request, pending_for_you, ('start_date', 'id'), 'team')
+        context['team_feed_url'] = request.build_absolute_uri(reverse('ics_feed', args=[feeds.feed_token(user, 'team')]))
 
     return render(request, 'vts/home.html', context)
 
@@ -73,39 +116,40 @@ def request_editor(request):
             new_request = form.save(commit=False)
             new_request.employee = request.user
 
-            # Try to retrieve the existing leave balance, or create one if it doesn't exist.
-            balance, created = UserLeaveBalance.objects.get_or_create(
-                user=request.user, 
-                category=new_request.category,
-                defaults={}  # We'll update the defaults below.
-            )
-
-            if created:
-                # Since this is a new balance record, look up the matching grant.
-                try:
-                    grant = Grant.objects.get(employee_category=request.user.role, category=new_request.category)
-                except Grant.DoesNotExist:
+            # Balances are provisioned in bulk from the Grants; provision this
+            # user on the spot only if they somehow missed that.
+            balance = UserLeaveBalance.objects.filter(user=request.user, category=new_request.category).first()
+            if balance is None:
+                provision_user(request.user)
+                balance = UserLeaveBalance.objects.filter(user=request.user, category=new_request.category).first()
+                if balance is None:
                     return HttpResponse("No grant exists for this user and category.", status=400)
-                # Initialize the balance from the grant.
-                balance.allocated_hours = grant.allocated_hours
-                balance.remaining_hours = grant.allocated_hours
-                balance.save()
 
             # Calculate total requested hours:
             days = abs(new_request.end_date - new_request.start_date).days + 1
             requested_hours = days * new_request.hours_per_day
 
+            # Cheap early exit; the conditional deduction below is what actually guards the balance.
             if balance.remaining_hours < requested_hours:
                 return HttpResponse("Insufficient leave balance.", status=400)
 
-            # Save the request
-            new_request.status = 'submitted'
-            new_request.submitted_at = timezone.now()
-            new_request.save()
-
-            # Deduct hours from the user’s leave balance.
-            balance.remaining_hours -= requested_hours
-            balance.save()
+            # Save the request and deduct the hours in one transaction. The
+            # deduction is a conditional UPDATE, so concurrent submits can
+            # neither overdraw the balance nor overwrite each other's deductions.
+            with transaction.atomic():
+                new_request.status = 'submitted'
+                new_request.submitted_at = timezone.now()
+                new_request.save()
+                deducted = UserLeaveBalance.deduct(balance.pk, requested_hours)
+                if deducted:
+                    LeaveLedgerEntry.objects.create(
+                        user=request.user, category=new_request.category,
+                        kind='debit', hours=-requested_hours, request=new_request,
+                    )
+                else:
+                    transaction.set_rollback(True)
+            if not deducted:
+                return HttpResponse("Insufficient leave balance.", status=400)
 
             return redirect('home')
     else:
@@ -113,6 +157,264 @@ def request_editor(request):
     
     return render(request, 'vts/request_editor.html', {'form': form})
 
+@login_required
+def request_availability(request):
+    """
+    Returns, for each day of the coming horizon, whether a one-day request
+    in the given category would pass validation. All days are checked in
+    one Request.validate_many() batch so the date picker can grey out
+    unavailable days before the employee submits.
+    """
+    try:
+        category = Category.objects.get(pk=int(request.GET.get('category', '')))
+        horizon = int(request.GET.get('horizon', 120))
+        hours_per_day = float(request.GET.get('hours_per_day', 8))
+    except (ValueError, Category.DoesNotExist):
+        return JsonResponse({'error': "A valid category is required."}, status=400)
+    if not 1 <= horizon <= MAX_AVAILABILITY_HORIZON:
+        return JsonResponse({'error': f"Horizon must be between 1 and {MAX_AVAILABILITY_HORIZON} days."}, status=400)
+    if not 0 < hours_per_day <= 24:
+        return JsonResponse({'error': "hours_per_day must be a number between 0 and 24."}, status=400)
+
+    today = timezone.now().date()
+    days = [today + datetime.timedelta(days=offset) for offset in range(horizon)]
+    candidates = [
+        Request(employee=request.user, category=category, start_date=day, end_date=day, hours_per_day=hours_per_day)
+        for day in days
+    ]
+    results = Request.validate_many(candidates)
+    return JsonResponse({
+        'category': category.pk,
+        'start': today.isoformat(),
+        'horizon': horizon,
+        'days': [
+            {'date': day.isoformat(), 'available': not errors, 'errors': errors}
+            for day, errors in zip(days, results)
+        ],
+    })
+
+
+# JSON API
+# Read-only request listings, serialized straight from values() rows and
+# paginated by keyset on (start_date, id): pass the returned next_cursor
+# back as ?cursor= to get the following page.
+API_DEFAULT_PAGE_SIZE = 50
+API_MAX_PAGE_SIZE = 200
+
+API_REQUEST_FIELDS = (
+    'id', 'employee_id', 'category_id', 'title', 'start_date', 'end_date', 'hours_per_day', 'status', 'submitted_at',
+)
+API_REQUEST_JOINED_FIELDS = {
+    'employee_name': F('employee__username'),
+    'location_id': F('employee__location_id'),
+    'category_name': F('category__name'),
+}
+
+
+def _filter_requests(queryset, params):
+    """
+    Apply the listing filters from the query string: status (repeatable or
+    comma-separated), category, location, and a from/to date range matching
+    requests that overlap it. Raises ValueError for bad values.
+    """
+    statuses = [status for value in params.getlist('status') for status in value.split(',') if status]
+    if statuses:
+        known = {status for status, _ in Request.STATUS_CHOICES}
+        unknown = set(statuses) - known
+        if unknown:
+            raise ValueError(f"Unknown status: {', '.join(sorted(unknown))}.")
+        queryset = queryset.filter(status__in=statuses)
+    if params.get('category'):
+        queryset = queryset.filter(category_id=int(params['category']))
+    if params.get('location'):
+        queryset = queryset.filter(employee__location_id=int(params['location']))
+    if params.get('from'):
+        queryset = queryset.filter(end_date__gte=datetime.date.fromisoformat(params['from']))
+    if params.get('to'):
+        queryset = queryset.filter(start_date__lte=datetime.date.fromisoformat(params['to']))
+    return queryset
+
+
+def _request_listing(request, queryset):
+    try:
+        queryset = _filter_requests(queryset, request.GET)
+        page_size = int(request.GET.get('page_size', API_DEFAULT_PAGE_SIZE))
+    except ValueError as error:
+        return JsonResponse({'error': str(error) or "Invalid filter value."}, status=400)
+    if not 1 <= page_size <= API_MAX_PAGE_SIZE:
+        return JsonResponse({'error': f"page_size must be between 1 and {API_MAX_PAGE_SIZE}."}, status=400)
+    rows = queryset.values(*API_REQUEST_FIELDS, **API_REQUEST_JOINED_FIELDS)
+    try:
+        page = paginate(rows, ('start_date', 'id'), request.GET.get('cursor'), page_size)
+    except InvalidCursor as error:
+        return JsonResponse({'error': str(error)}, status=400)
+    return JsonResponse({
+        'results': page.items,
+        'next_cursor': page.next_cursor,
+        'next': request.build_absolute_uri(page_url(request, 'cursor', page.next_cursor)) if page.has_next else None,
+    })
+
+
+@login_required
+def api_my_requests(request):
+    """The signed-in employee's own request history."""
+    return _request_listing(request, Request.objects.filter(employee=request.user))
+
+
+@login_required
+def api_pending_requests(request):
+    """Submitted requests of the signed-in manager's subordinates."""
+    if request.user.role != 'manager':
+        return JsonResponse({'error': "Permission denied"}, status=403)
+    queryset = Request.objects.filter(employee__in=request.user.subordinates.values('id'), status='submitted')
+    return _request_listing(request, queryset)
+
+
+@login_required
+def api_search_requests(request):
+    """Every request in the system, for HR."""
+    if request.user.role != 'hr_clerk':
+        return JsonResponse({'error': "Permission denied"}, status=403)
+    return _request_listing(request, Request.objects.all())
+
+
+# Streaming exports
+# CSV or JSON Lines generated row by row from values_list() iterators, so
+# memory stays flat and the first rows go out before the query finishes.
+EXPORT_CHUNK_SIZE = 2000
+EXPORT_ROWS_PER_WRITE = 500
+
+REQUEST_EXPORT_COLUMNS = (
+    ('id', 'id'),
+    ('employee', 'employee__username'),
+    ('location', 'employee__location__name'),
+    ('category', 'category__name'),
+    ('title', 'title'),
+    ('description', 'description'),
+    ('start_date', 'start_date'),
+    ('end_date', 'end_date'),
+    ('hours_per_day', 'hours_per_day'),
+    ('status', 'status'),
+    ('submitted_at', 'submitted_at'),
+    ('created_at', 'created_at'),
+)
+
+BALANCE_EXPORT_COLUMNS = (
+    ('user', 'user__username'),
+    ('location', 'user__location__name'),
+    ('category', 'category__name'),
+    ('period_year', 'period_year'),
+    ('allocated_hours', 'allocated_hours'),
+    ('remaining_hours', 'remaining_hours'),
+)
+
+
+class _Echo:
+    """File-like object whose write() hands the written text straight back, for csv.writer."""
+    def write(self, value):
+        return value
+
+
+def _export_value(value):
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    return value
+
+
+def _stream_export(queryset, columns, fmt):
+    names = [name for name, _ in columns]
+    rows = queryset.values_list(*[path for _, path in columns]).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    if fmt == 'csv':
+        writer = csv.writer(_Echo())
+        yield writer.writerow(names)  # Sent straight away, before the query has finished.
+        lines = (writer.writerow([_export_value(value) for value in row]) for row in rows)
+    else:
+        lines = (json.dumps(dict(zip(names, map(_export_value, row)))) + "\n" for row in rows)
+    # Hand the server a few hundred rows at a time rather than one write per row.
+    while True:
+        batch = ''.join(itertools.islice(lines, EXPORT_ROWS_PER_WRITE))
+        if not batch:
+            return
+        yield batch
+
+
+def _export_response(request, queryset, columns, basename):
+    fmt = request.GET.get('format', 'csv')
+    if fmt not in ('csv', 'jsonl'):
+        return HttpResponse("format must be csv or jsonl", status=400)
+    content_type = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    response = StreamingHttpResponse(_stream_export(queryset, columns, fmt), content_type=f'{content_type}; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{basename}-{timezone.now().date().isoformat()}.{fmt}"'
+    return response
+
+
+@login_required
+def export_requests(request):
+    """
+    Every request matching the filters (status, category, location, from/to
+    as in the JSON API), as CSV or JSON Lines. The CSV can be read back by
+    the import_requests command.
+    """
+    if request.user.role != 'hr_clerk':
+        return HttpResponse("Permission denied", status=403)
+    try:
+        queryset = _filter_requests(Request.objects.order_by('id'), request.GET)
+    except ValueError as error:
+        return HttpResponse(str(error) or "Invalid filter value.", status=400)
+    return _export_response(request, queryset, REQUEST_EXPORT_COLUMNS, 'leave-requests')
+
+
+@login_required
+def export_balances(request):
+    """Leave balances, optionally filtered by category, location and leave year."""
+    if request.user.role != 'hr_clerk':
+        return HttpResponse("Permission denied", status=403)
+    queryset = UserLeaveBalance.objects.order_by('id')
+    try:
+        if request.GET.get('category'):
+            queryset = queryset.filter(category_id=int(request.GET['category']))
+        if request.GET.get('location'):
+            queryset = queryset.filter(user__location_id=int(request.GET['location']))
+        if request.GET.get('year'):
+            queryset = queryset.filter(period_year=int(request.GET['year']))
+    except ValueError:
+        return HttpResponse("Invalid filter value.", status=400)
+    return _export_response(request, queryset, BALANCE_EXPORT_COLUMNS, 'leave-balances')
+
+
+def ics_feed(request, token):
+    """
+    Approved leave as an iCalendar feed, addressed by a signed token (see
+    leave.feeds) so calendar clients can poll it without logging in.
+    Answers 304 when the client's ETag is still current.
+    """
+    try:
+        user_id, kind, version = feeds.read_feed_token(token)
+        user = User.objects.get(pk=user_id, is_active=True, feed_version=version)
+    except (signing.BadSignature, User.DoesNotExist):
+        return HttpResponse("Unknown feed", status=404)
+    if kind == 'team' and user.role != 'manager':
+        return HttpResponse("Unknown feed", status=404)
+
+    requests = feeds.feed_requests(user, kind)
+    etag = feeds.feed_etag(requests)
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        return not_modified
+
+    name = f"{user.username} team leave" if kind == 'team' else f"{user.username} leave"
+    response = StreamingHttpResponse(feeds.stream_feed(requests, kind, name), content_type='text/calendar; charset=utf-8')
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+@login_required
+@require_POST
+def reset_feed_links(request):
+    """Revoke the user's calendar feed URLs; the home page then shows new ones."""
+    User.objects.filter(pk=request.user.pk).update(feed_version=F('feed_version') + 1)
+    return redirect('home')
 
 
 @login_required
@@ -122,8 +424,10 @@ def withdraw_request(request, request_id):
     """
     req_obj = get_object_or_404(Request, id=request_id, employee=request.user, status='submitted')
     if request.method == 'POST':
-        req_obj.status = 'withdrawn'
-        req_obj.save()
+        with transaction.atomic():
+            req_obj.status = 'withdrawn'
+            req_obj.save()
+            UserLeaveBalance.refund_request(req_obj)
         # (Optional: Trigger email notification to the manager here)
         return redirect('home')
     
@@ -141,9 +445,12 @@ def cancel_request(request, request_id):
         # For recent past requests, an explanation might be required.
         explanation = request.POST.get('explanation', '')
         # (Optional: Save the explanation or log it as needed)
-        req_obj.status = 'cancelled'
-        req_obj.save()
-        # (Optional: Reallocate time allowances and send notification email)
+        with transaction.atomic():
+            req_obj.status = 'cancelled'
+            req_obj.save()
+            # Reallocate the time allowance.
+            UserLeaveBalance.refund_request(req_obj)
+        # (Optional: send notification email)
         return redirect('home')
     
     return render(request, 'vts/cancel_confirmation.html', {'request_obj': req_obj})
@@ -153,12 +460,18 @@ def edit_request(request, request_id):
     """
     Allows an employee to edit a pending vacation request.
     The employee may update details like the title, description, or dates.
+    The balance and ledger follow the new hours and category.
     """
     req_obj =  get_object_or_404(Request, id=request_id, employee=request.user, status='submitted')
     if request.method == 'POST':
         form = RequestForm(request.POST, instance=req_obj)
         if form.is_valid():
-            form.save()
+            with transaction.atomic():
+                edited = form.save()
+                days = abs(edited.end_date - edited.start_date).days + 1
+                if not UserLeaveBalance.rebook_request(edited, days * edited.hours_per_day):
+                    transaction.set_rollback(True)
+                    return HttpResponse("Insufficient leave balance.", status=400)
             return redirect('home')
     else:
         form = RequestForm(instance=req_obj)
@@ -182,17 +495,15 @@ def approve_request(request, request_id):
         return redirect('home')
     
     if request.method == 'POST':
-        req_obj.status = 'approved'
-        req_obj.save()
-        
-        # Optionally send an email notification to the employee.
-        send_mail(
-            subject="Your vacation request has been approved",
-            message=f"Hello {req_obj.employee.username}, your vacation request '{req_obj.title}' has been approved.",
-            from_email="no-reply@yourcompany.com",
-            recipient_list=[req_obj.employee.email],
-            fail_silently=True,
-        )
+        with transaction.atomic():
+            req_obj.status = 'approved'
+            req_obj.save()
+            # Notify the employee; the send_outbox worker delivers it.
+            OutboxEmail.enqueue(
+                subject="Your vacation request has been approved",
+                body=f"Hello {req_obj.employee.username}, your vacation request '{req_obj.title}' has been approved.",
+                recipients=[req_obj.employee.email],
+            )
         return redirect('home')
     
     return render(request, 'vts/approve_confirmation.html', {'request_obj': req_obj})
@@ -215,41 +526,262 @@ def reject_request(request, request_id):
             error_message = "Please provide an explanation for rejection."
             return render(request, 'vts/reject_request.html', {'request_obj': req_obj, 'error': error_message})
         
-        req_obj.status = 'rejected'
-        req_obj.save()
-        
-        # Optionally send an email notification to the employee.
-        send_mail(
-            subject="Your vacation request has been rejected",
-            message=f"Hello {req_obj.employee.username}, your vacation request '{req_obj.title}' has been rejected.\nExplanation: {explanation}",
-            from_email="no-reply@yourcompany.com",
-            recipient_list=[req_obj.employee.email],
-            fail_silently=True,
-        )
+        with transaction.atomic():
+            req_obj.status = 'rejected'
+            req_obj.save()
+            UserLeaveBalance.refund_request(req_obj)
+            # Notify the employee; the send_outbox worker delivers it.
+            OutboxEmail.enqueue(
+                subject="Your vacation request has been rejected",
+                body=f"Hello {req_obj.employee.username}, your vacation request '{req_obj.title}' has been rejected.\nExplanation: {explanation}",
+                recipients=[req_obj.employee.email],
+            )
         return redirect('home')
     
     return render(request, 'vts/reject_request.html', {'request_obj': req_obj})
 
+@login_required
+@require_POST
+def bulk_review_requests(request):
+    """
+    Approves or rejects the requests selected in the "Pending For Approval
+    By You" table in one go. Authority is re-checked for the whole set in
+    one query and the status change is a single UPDATE; requests that are
+    no longer pending (e.g., withdrawn meanwhile) are skipped and reported.
+    Notifications are queued in the outbox in the same transaction.
+    """
+    if request.user.role != 'manager':
+        return HttpResponse("Permission denied", status=403)
+
+    action = request.POST.get('action')
+    if action not in ('approve', 'reject'):
+        return HttpResponse("Unknown action", status=400)
+    try:
+        request_ids = {int(request_id) for request_id in request.POST.getlist('request_ids')}
+    except ValueError:
+        return HttpResponse("Invalid request id", status=400)
+    explanation = request.POST.get('explanation', '').strip()
+    if action == 'reject' and not explanation:
+        return HttpResponse("Please provide an explanation for rejection.", status=400)
+    new_status = 'approved' if action == 'approve' else 'rejected'
+
+    with transaction.atomic():
+        # Only requests of this manager's subordinates; locked until commit
+        # where the database supports it, so the status read here holds.
+        rows = list(Request.objects.select_for_update(of=('self',)).filter(
+            pk__in=request_ids, employee__managers=request.user
+        ).values('id', *RequestState._fields, 'title', 'employee__username', 'employee__email'))
+        changed = [row for row in rows if row['status'] == 'submitted']
+        skipped = [row for row in rows if row['status'] != 'submitted']
+        changed_ids = [row['id'] for row in changed]
+        if changed_ids:
+            Request.objects.filter(pk__in=changed_ids).update(status=new_status, updated_at=timezone.now())
+            # update() bypasses the Request signals, so keep the derived tables in step here.
+            old_states = [RequestState(*(row[field] for field in RequestState._fields)) for row in changed]
+            aggregates.apply_request_changes([(state, state._replace(status=new_status)) for state in old_states])
+            if action == 'reject':
+                UserLeaveBalance.refund_requests(changed_ids)
+            # Notify the employees; the send_outbox worker delivers these.
+            if action == 'approve':
+                subject = "Your vacation request has been approved"
+                body = "Hello {username}, your vacation request '{title}' has been approved."
+            else:
+                subject = "Your vacation request has been rejected"
+                body = "Hello {username}, your vacation request '{title}' has been rejected.\nExplanation: {explanation}"
+            OutboxEmail.objects.bulk_create([
+                OutboxEmail.build(
+                    subject=subject,
+                    body=body.format(username=row['employee__username'], title=row['title'], explanation=explanation),
+                    recipients=[row['employee__email']],
+                )
+                for row in changed if row['employee__email']
+            ])
+
+    return render(request, 'vts/bulk_review_result.html', {
+        'new_status': new_status,
+        'changed': changed,
+        'skipped': skipped,
+        'not_permitted': sorted(request_ids - {row['id'] for row in rows}),
+    })
+
+@login_required
+def team_calendar(request):
+    """
+    Month or quarter grid of the manager's subordinates' approved and
+    submitted leave (see leave.team_calendar).
+    """
+    if request.user.role != 'manager':
+        return HttpResponse("Permission denied", status=403)
+    span = request.GET.get('span', 'month')
+    if span not in team_calendar_grid.SPANS:
+        return HttpResponse("span must be month or quarter", status=400)
+    try:
+        window_start = datetime.datetime.strptime(request.GET['month'], "%Y-%m").date() if request.GET.get('month') else timezone.now().date().replace(day=1)
+    except ValueError:
+        return HttpResponse("month must be in YYYY-MM format", status=400)
+    months = team_calendar_grid.SPANS[span]
+    return render(request, 'vts/team_calendar.html', {
+        'grid': mark_safe(team_calendar_grid.render_team_calendar(request.user, window_start, span)),
+        'span': span,
+        'window_start': window_start,
+        'window_last_month': team_calendar_grid.add_months(window_start, months - 1),
+        'previous_month': team_calendar_grid.add_months(window_start, -months),
+        'next_month': team_calendar_grid.add_months(window_start, months),
+    })
 
 
 # HR_clerk functionality
+# Rows per page of the HR restriction list.
+HR_RESTRICTION_PAGE_SIZE = 50
+
+
+def _restrictions_after(RestrictionClass, cursor):
+    """Restrictions of one type that sort after the cursor (name, type name, id)."""
+    queryset = RestrictionClass.objects.all()
+    if cursor is None:
+        return queryset
+    name, type_name, restriction_id = cursor
+    if RestrictionClass.__name__ > type_name:
+        return queryset.filter(name__gte=name)
+    if RestrictionClass.__name__ == type_name:
+        return queryset.filter(Q(name__gt=name) | Q(name=name, id__gt=restriction_id))
+    return queryset.filter(name__gt=name)
+
+
+def _restriction_usage(restrictions):
+    """
+    Active requests each restriction currently covers: requests in its
+    categories by employees at its locations (or anywhere if it has none).
+    One aggregate query for the whole page.
+    """
+    category_ids = {category.pk for restr in restrictions for category in restr.category.all()}
+    counts = {}
+    if category_ids:
+        rows = Request.objects.filter(
+            category_id__in=category_ids, status__in=Request.ACTIVE_STATUSES
+        ).values_list('category_id', 'employee__location_id').annotate(n=Count('id'))
+        for category_id, location_id, n in rows:
+            counts.setdefault(category_id, {})[location_id] = n
+    usage = {}
+    for restr in restrictions:
+        location_ids = {location.pk for location in restr.location.all()}
+        usage[restr] = sum(
+            n
+            for category in restr.category.all()
+            for location_id, n in counts.get(category.pk, {}).items()
+            if not location_ids or location_id in location_ids
+        )
+    return usage
+
+
 @login_required
 def hr_restriction_list(request):
     if request.user.role != 'hr_clerk':
         return HttpResponse("Permission denied", status=403)
-    
-    # Combine restrictions from all concrete subclasses
-    restrictions = []
-    restrictions += list(DateExclusionRestriction.objects.all())
-    restrictions += list(AdjacentDayRestriction.objects.all())
-    restrictions += list(ConsecutiveDayRestriction.objects.all())
-    restrictions += list(CoworkerRestriction.objects.all())
-    restrictions += list(DayOfWeekRestriction.objects.all())
-    restrictions += list(PeriodLimitRestriction.objects.all())
-    
-    context = {'restrictions': restrictions}
+
+    restriction_types = {RestrictionClass.__name__: RestrictionClass for RestrictionClass in RESTRICTION_CLASSES}
+    selected_type = request.GET.get('type', '')
+    try:
+        category_id = int(request.GET['category']) if request.GET.get('category') else None
+        location_id = int(request.GET['location']) if request.GET.get('location') else None
+    except ValueError:
+        return HttpResponse("Invalid filter", status=400)
+    cursor = request.GET.get('cursor')
+    after = None
+    if cursor:
+        try:
+            name, type_name, restriction_id = parse_cursor(cursor, 3)
+            after = (name, type_name, int(restriction_id))
+        except (ValueError, TypeError):
+            cursor = None  # Bad cursor: start from the first page.
+
+    # One query per restriction type (plus the prefetches), each limited to a
+    # page, merged in (name, type, id) order.
+    streams = []
+    for type_name, RestrictionClass in restriction_types.items():
+        if selected_type and type_name != selected_type:
+            continue
+        queryset = _restrictions_after(RestrictionClass, after)
+        if category_id is not None:
+            queryset = queryset.filter(category=category_id)
+        if location_id is not None:
+            # Restrictions linked to the location, or to none (they apply everywhere).
+            queryset = queryset.filter(Q(location=location_id) | Q(location__isnull=True))
+        queryset = queryset.distinct().order_by('name', 'id').prefetch_related('category', 'location')
+        rows = list(queryset[:HR_RESTRICTION_PAGE_SIZE + 1])
+        streams.append([((restr.name, type_name, restr.pk), restr) for restr in rows])
+    merged = list(itertools.islice(heapq.merge(*streams, key=lambda item: item[0]), HR_RESTRICTION_PAGE_SIZE + 1))
+    restrictions = [restr for _, restr in merged[:HR_RESTRICTION_PAGE_SIZE]]
+    next_url = None
+    if len(merged) > HR_RESTRICTION_PAGE_SIZE:
+        next_url = page_url(request, 'cursor', encode_cursor(merged[HR_RESTRICTION_PAGE_SIZE - 1][0]))
+
+    usage = _restriction_usage(restrictions)
+    context = {
+        'restrictions': [(restr, type(restr).__name__, usage[restr]) for restr in restrictions],
+        'restriction_types': list(restriction_types),
+        'categories': Category.objects.order_by('name'),
+        'locations': Location.objects.order_by('name'),
+        'selected_type': selected_type,
+        'selected_category': category_id,
+        'selected_location': location_id,
+        'next_url': next_url,
+        'first_url': page_url(request, 'cursor', None) if cursor else None,
+    }
     return render(request, 'vts/hr_restriction_list.html', context)
 
+@login_required
+def hr_utilization_report(request):
+    """
+    Hours taken and pending per location, category and month of a year,
+    read from UtilizationRollup, with the share of the year's granted
+    hours already taken. Costs two grouped queries whatever the size of
+    the Request table.
+    """
+    if request.user.role != 'hr_clerk':
+        return HttpResponse("Permission denied", status=403)
+    try:
+        year = int(request.GET.get('year') or timezone.localdate().year)
+        months = [datetime.date(year, month, 1) for month in range(1, 13)]
+    except ValueError:
+        return HttpResponse("Invalid year", status=400)
+
+    rows = {}
+    rollups = UtilizationRollup.objects.filter(
+        month__gte=months[0], month__lte=months[-1]
+    ).values_list('location__name', 'category__name', 'location_id', 'category_id', 'month', 'taken_hours', 'pending_hours')
+    for location_name, category_name, location_id, category_id, month, taken, pending in rollups:
+        row = rows.setdefault((location_id, category_id), {
+            'location': location_name,
+            'category': category_name,
+            'months': [(0, 0)] * 12,
+            'taken': 0,
+            'pending': 0,
+            'granted': None,
+            'share': None,
+        })
+        row['months'][month.month - 1] = (taken, pending)
+        row['taken'] += taken
+        row['pending'] += pending
+    # Balances only hold the allocation of the year they are in, so the
+    # share is available for the current leave year and not for past ones.
+    granted = UserLeaveBalance.objects.filter(period_year=year, user__location__isnull=False).values_list(
+        'user__location_id', 'category_id'
+    ).annotate(granted=Sum('allocated_hours')).order_by()
+    for location_id, category_id, granted_hours in granted:
+        if (location_id, category_id) in rows:
+            row = rows[(location_id, category_id)]
+            row['granted'] = granted_hours
+            row['share'] = row['taken'] / granted_hours * 100 if granted_hours else None
+
+    context = {
+        'year': year,
+        'months': months,
+        'rows': sorted(rows.values(), key=lambda row: (row['location'], row['category'])),
+    }
+    return render(request, 'vts/hr_utilization_report.html', context)
+
+
 @login_required
 def hr_restriction_create(request):
     if request.user.role != 'hr_clerk':
@@ -302,6 +834,16 @@ def hr_restriction_create(request):
     
     return render(request, 'vts/hr_restriction_form.html', {'form': form})
 
+def metrics_endpoint(request):
+    """
+    Restriction validation metrics in the Prometheus text exposition format.
+    Restricted to staff, allowed addresses and the scrape token; see
+    leave.metrics.may_scrape().
+    """
+    if not metrics.may_scrape(request):
+        return HttpResponse("Permission denied", status=403)
+    return HttpResponse(metrics.render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 def register(request):
     if request.method == 'POST':
         form = CustomUserCreationForm(request.POST)